@@ -5,9 +5,12 @@ import sys
 import json
 import time
 import logging
+import socket
 import pathlib
-from datetime import datetime
+from datetime import datetime, timezone
 import boto3
+from botocore.exceptions import ClientError
+from werkzeug.exceptions import HTTPException
 
 from flask import (
     Flask,
@@ -19,6 +22,7 @@ from flask import (
     jsonify,
     send_file,
     abort,
+    Response,
 )
 from flask_login import (
     LoginManager,
@@ -32,6 +36,11 @@ import click
 
 from user_repository import DynamoUserRepository, DynamoUser
 from parameter_store import parameter_store
+from task_registry import task_registry, TaskRecord
+from artifact_index import artifact_index, ArtifactRecord
+from progress_stream import ProgressStream
+from job_queue import JobQueue, Job, PRIORITIES, JOB_MAX_RUNNING
+from executors import create_executor
 
 HAVE_ADMIN = False
 
@@ -50,7 +59,6 @@ csrf = CSRFProtect(app)
 user_repo = DynamoUserRepository()
 
 # AWS clients
-ecs_client = boto3.client('ecs')
 s3_client = boto3.client('s3')
 
 # ────────────────────────────────────────────────────────────────────────────
@@ -59,6 +67,10 @@ s3_client = boto3.client('s3')
 OUTPUT_ROOT = pathlib.Path(app.root_path) / "outputs"   # local temp files for compatibility
 OUTPUT_ROOT.mkdir(exist_ok=True)
 
+# "s3" keeps progress and reports in REPORT_BUCKET; "local" keeps them under
+# OUTPUT_ROOT, for REPORT_EXECUTOR=local runs that need no AWS at all.
+REPORT_STORAGE = os.getenv("REPORT_STORAGE", "s3")
+
 # ────────────────────────────────────────────────────────────────────────────
 # Logging
 # ────────────────────────────────────────────────────────────────────────────
@@ -167,12 +179,14 @@ def discover_reports_for(user: DynamoUser):
 def healthz():
     return jsonify({
         "status": "healthy",
-        "service": "data-reports"
+        "service": "data-reports",
+        "parameters": parameter_store.stats(),
     }), 200
 
 @app.before_request
 def before_request():
-    pass
+    # First request of this process: start dispatching (and recovering lost jobs)
+    job_queue.start()
     # Uncomment for production
     # if not request.is_secure and not app.debug:
     #     url = request.url.replace('http://', 'https://', 1)
@@ -204,57 +218,175 @@ def index():
         flash("No reports available", "warning")
     return render_template("index.html", reports=reports, user=current_user)
 
+# ────────────────────────────────────────────────────────────────────────────
+# Helper: report storage (an S3 bucket, or OUTPUT_ROOT when bucket is None)
+# ────────────────────────────────────────────────────────────────────────────
+def local_path(key: str) -> pathlib.Path:
+    return OUTPUT_ROOT / key.removeprefix("outputs/")
+
+def storage_url(bucket, key: str) -> str:
+    """Path handed to the report script for ``key``."""
+    return f"s3://{bucket}/{key}" if bucket else str(local_path(key))
+
+def read_object(bucket, key: str):
+    """Return the object's bytes, or None if it does not exist yet."""
+    if not bucket:
+        try:
+            return local_path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+    try:
+        return s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+def head_object(bucket, key: str):
+    """Return ``head_object``-style size and modified time, or None if missing."""
+    if not bucket:
+        try:
+            stat = local_path(key).stat()
+        except FileNotFoundError:
+            return None
+        return {'ContentLength': stat.st_size,
+                'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)}
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return None
+        raise
+
+# ────────────────────────────────────────────────────────────────────────────
+# Helper: record a finished task's output in the artifact index
+# ────────────────────────────────────────────────────────────────────────────
+def index_artifact(task: TaskRecord):
+    """Return the task's artifact, indexing it from a head_object on its exact key if needed."""
+    artifact = artifact_index.get(task.task_id)
+    if artifact:
+        return artifact
+    head = head_object(task.bucket, task.output_key)
+    if head is None:
+        return None
+    return artifact_index.put(ArtifactRecord.from_head(
+        task.task_id, task.bucket, task.output_key, task.output_format, head))
+
+def legacy_artifact(task_id: str, user):
+    """Find a report made before tasks were registered, by the task ID that ends its key.
+
+    Those reports have no task record, so the key's site decides access: admins
+    see every site, others their own. The first download lists that site's
+    outputs (paginated) and indexes the match, so later ones are a keyed get.
+    """
+    if REPORT_STORAGE != "s3" or not task_id.isdigit():
+        return None
+    prefix = "outputs/" if user.role == "admin" else f"outputs/{user.site}/"
+    artifact = artifact_index.get(task_id)
+    if artifact:
+        return artifact if artifact.key.startswith(prefix) else None
+
+    bucket_name = parameter_store.get_parameter('REPORT_BUCKET')
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            stem, _, extension = obj['Key'].rpartition('.')
+            if stem.endswith(f"_{task_id}") and extension in ('html', 'pdf'):
+                logger.info(f"Indexing pre-registry report {obj['Key']}")
+                return artifact_index.put(ArtifactRecord.from_head(
+                    task_id, bucket_name, obj['Key'], extension,
+                    {'ContentLength': obj['Size'], 'LastModified': obj['LastModified']}))
+    return None
+
 # ────────────────────────────────────────────────────────────────────────────
 # Progress API
 # ────────────────────────────────────────────────────────────────────────────
+def read_progress(task: TaskRecord) -> dict:
+    """Fetch a task's progress JSON; the first finished read also updates its status and artifact."""
+    body = read_object(task.bucket, task.progress_key)
+    if body is None:
+        if task.status == "failed":
+            return {'progress': -1, 'message': "Failed to start report generation"}
+        if task.status == "queued":
+            ahead = job_queue.position(task.task_id)
+            return {'progress': 0, 'message': f"Queued ({ahead} ahead)…" if ahead else "Queued…"}
+        # The container has not written its first update yet
+        return {'progress': 0, 'message': "Starting…"}
+
+    progress = json.loads(body)
+    value = progress.get('progress', 0)
+    if task.status == "failed" and 0 <= value < 100:
+        # The run died without reporting it (killed, crashed on import)
+        progress = {'progress': -1, 'message': "Report generation failed"}
+        value = -1
+    if not task.finished and (value >= 100 or value < 0):
+        task.status = "done" if value >= 100 else "failed"
+        task_registry.update_status(task.task_id, task.status)
+        if value >= 100:
+            index_artifact(task)
+    if value >= 100:
+        progress['download_url'] = f"/download/{task.task_id}"
+    return progress
+
+progress_stream = ProgressStream(read_progress)
+
 @app.route("/progress/<task_id>")
 @login_required  
 def check_progress(task_id):
+    task = task_registry.get(task_id)
+    if not task:
+        return jsonify(progress=-1, message="Unknown task"), 404
+    if not task.can_view(current_user):
+        return jsonify(progress=-1, message="Not authorised for that task"), 403
+
     try:
-        bucket_name = parameter_store.get_parameter('REPORT_BUCKET')
-        
-        # Search for progress file in the hierarchical structure
-        response = s3_client.list_objects_v2(
-            Bucket=bucket_name, 
-            Prefix=f'progress/',
-            Delimiter='/'
-        )
-        
-        # Find the progress file for this task_id
-        for obj in response.get('Contents', []):
-            if obj['Key'].endswith(f'{task_id}.json'):
-                progress_response = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])
-                return jsonify(json.loads(progress_response['Body'].read()))
-        
-        return jsonify(progress=0, message="Starting…")
+        return jsonify(read_progress(task))
     except Exception as e:
         logger.error(f"Progress check error: {e}")
         return jsonify(progress=0, message="Error checking progress")
 
+@app.route("/progress/<task_id>/stream")
+@login_required
+def stream_progress(task_id):
+    """Server-Sent Events: one ``progress`` event per change, ending with the finished/failed one."""
+    task = task_registry.get(task_id)
+    if not task:
+        return jsonify(progress=-1, message="Unknown task"), 404
+    if not task.can_view(current_user):
+        return jsonify(progress=-1, message="Not authorised for that task"), 403
+
+    return Response(
+        progress_stream.events(task),
+        mimetype="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 # ────────────────────────────────────────────────────────────────────────────
 # Download endpoint
 # ────────────────────────────────────────────────────────────────────────────
 @app.route("/download/<task_id>")
 @login_required
 def download_report(task_id):
+    task = task_registry.get(task_id)
+    if task and not task.can_view(current_user):
+        abort(403, "Not authorised for that report")
+
     try:
-        bucket_name = parameter_store.get_parameter('REPORT_BUCKET')
-        
-        # List objects to find the report file
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=f'outputs/')
-        
-        for obj in response.get('Contents', []):
-            if task_id in obj['Key'] and obj['Key'].endswith(('.html', '.pdf')):
-                # Generate presigned URL for download
-                url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': bucket_name, 'Key': obj['Key']},
-                    ExpiresIn=3600
-                )
-                return redirect(url)
-        
-        abort(404, "Report not found")
-        
+        artifact = index_artifact(task) if task else legacy_artifact(task_id, current_user)
+        if not artifact:
+            abort(404, "Report not found")
+
+        if not artifact.bucket:
+            return send_file(local_path(artifact.key))
+
+        # Generate presigned URL for download
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': artifact.bucket, 'Key': artifact.key},
+            ExpiresIn=3600
+        )
+        return redirect(url)
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Download error: {e}")
         abort(500, "Error retrieving report")
@@ -282,70 +414,125 @@ def generate_report():
     if current_user.role != "admin" and site != current_user.site:
         return jsonify(error="Not authorised for that site"), 403
 
+    priority = request.form.get("priority", "interactive")
+    if priority not in PRIORITIES:
+        return jsonify(error="Bad priority"), 400
+
     # Generate task ID and S3 paths
     task_id = str(time.time_ns())
     script_stem = script_name.rsplit(".", 1)[0]
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     try:
-        bucket_name = parameter_store.get_parameter('REPORT_BUCKET')
+        bucket_name = parameter_store.get_parameter('REPORT_BUCKET') if REPORT_STORAGE == "s3" else None
         output_key = f"outputs/{site}/{script_stem}/{script_stem}_{participant_id}_{ts}_{task_id}.{output_format}"
         progress_key = f"progress/{site}/{script_stem}/{task_id}.json"
         
-        output_path = f"s3://{bucket_name}/{output_key}"
-        progress_file = f"s3://{bucket_name}/{progress_key}"
-
-        # Get ECS configuration
-        cluster_name = parameter_store.get_parameter('ECS_CLUSTER')
-        subnet_id = parameter_store.get_parameter('SUBNET_ID')
-        security_group_id = parameter_store.get_parameter('SECURITY_GROUP_ID')
-        
-        # Get LAMP credentials from Parameter Store
-        lamp_access_key = parameter_store.get_parameter('LAMP_ACCESS_KEY')
-        lamp_secret_key = parameter_store.get_parameter('LAMP_SECRET_KEY')
-        lamp_server_address = parameter_store.get_parameter('LAMP_SERVER_ADDRESS')
-
-        # Run ECS task
-        response = ecs_client.run_task(
-            cluster=cluster_name,
-            taskDefinition=f'lamp-data-reports-dev',
-            launchType='FARGATE',
-            networkConfiguration={
-                'awsvpcConfiguration': {
-                    'subnets': [subnet_id],
-                    'securityGroups': [security_group_id],
-                    'assignPublicIp': 'ENABLED'
-                }
-            },
-            overrides={
-                'containerOverrides': [
-                    {
-                        'name': 'data-reports',
-                        'environment': [
-                            {'name': 'LAMP_ACCESS_KEY', 'value': lamp_access_key},
-                            {'name': 'LAMP_SECRET_KEY', 'value': lamp_secret_key},
-                            {'name': 'LAMP_SERVER_ADDRESS', 'value': lamp_server_address},
-                            {'name': 'TASK_ID', 'value': task_id}
-                        ],
-                        'command': [
-                            '--participant_id', participant_id,
-                            '--start_date', start_date,
-                            '--output_format', output_format,
-                            '--output_path', output_path,
-                            '--progress_file', progress_file,
-                        ]
-                    }
-                ]
-            }
-        )
-        
-        logger.info(f"Started ECS task for report {report_id}, task_id: {task_id}")
-        return jsonify(task_id=task_id)
+        output_path = storage_url(bucket_name, output_key)
+        progress_file = storage_url(bucket_name, progress_key)
+
+        job = Job(task_id=task_id, site=site, report_id=report_id, participant_id=participant_id,
+                  start_date=start_date, output_format=output_format, output_path=output_path,
+                  progress_file=progress_file, priority=priority)
+
+        def register(job):
+            # Registered before it can be dispatched so the first /progress poll finds it
+            task_registry.register(TaskRecord.new(
+                task_id=task_id, owner_id=current_user.id, site=site, report_id=report_id,
+                participant_id=participant_id, output_format=output_format, bucket=bucket_name,
+                progress_key=progress_key, output_key=output_key,
+                dispatcher=f"{HOST_ID}/{os.getpid()}"))
+
+        queued = job_queue.submit(job, on_accept=register)
+        if queued is not job:
+            # Same report already queued or running: follow that task instead
+            task_registry.add_viewer(queued.task_id, current_user.id)
+            logger.info(f"Joined in-flight task {queued.task_id} for report {report_id}")
+        else:
+            logger.info(f"Queued report {report_id}, task_id: {task_id} ({priority})")
+        return jsonify(task_id=queued.task_id, status=queued.state)
         
     except Exception as e:
-        logger.error(f"Failed to start ECS task: {e}")
+        logger.error(f"Failed to queue report: {e}")
         return jsonify(error="Failed to start report generation"), 500
 
+# ────────────────────────────────────────────────────────────────────────────
+# Job dispatch
+# ────────────────────────────────────────────────────────────────────────────
+def dispatch_job(job: Job):
+    task_registry.update_status(job.task_id, "running")
+    executor.launch(job)
+
+def job_finished(job: Job) -> bool:
+    task = task_registry.get(job.task_id)
+    if not task or task.finished:
+        return True
+    # Reading progress marks the task done/failed once its container reports it
+    read_progress(task)
+    return task.finished
+
+def job_failed(job: Job, error: Exception):
+    task_registry.update_status(job.task_id, "failed")
+
+def boot_id() -> str:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return "unknown"
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def task_lost(task: TaskRecord) -> bool:
+    """Whether the web process that queued ``task`` is gone, taking its in-memory queue with it."""
+    if not task.dispatcher:
+        # Queued before dispatchers were recorded; the deploy that added them replaced every process
+        return bool(task.created_at) and task.created_at < PROCESS_STARTED
+    host, _, pid = task.dispatcher.rpartition("/")
+    if host != HOST_ID:
+        # Another host's process; it recovers its own tasks when restarted there
+        return False
+    if int(pid) == os.getpid():
+        # Our pid, reused after a restart
+        return bool(task.created_at) and task.created_at < PROCESS_STARTED
+    return not process_alive(int(pid))
+
+def recover_lost_tasks():
+    """Fail the tasks a dead web process on this host accepted, so the UI offers a retry.
+
+    The job queue is in memory: a task queued by a process that has since
+    exited will never be dispatched. Local runs died with that process as well;
+    ECS tasks keep running and report through their progress file. Tasks of
+    sibling processes that are still alive (``gunicorn --workers N``) and of
+    other hosts are left alone.
+    """
+    lost_statuses = ("queued", "running") if executor.capacity is not None else ("queued",)
+    for task in task_registry.list_unfinished():
+        if task.status in lost_statuses and task_lost(task):
+            logger.warning(f"Task {task.task_id} was {task.status} in a web process that has exited; marking it failed")
+            task_registry.update_status(task.task_id, "failed")
+
+def job_exited(job: Job, returncode: int):
+    """Local runs: a script that died without writing -1 still fails its task."""
+    task = task_registry.get(job.task_id)
+    if returncode != 0 and task and not task.finished:
+        task_registry.update_status(job.task_id, "failed")
+
+executor = create_executor(str(OUTPUT_ROOT / "logs"), on_exit=job_exited)
+if REPORT_STORAGE == "local" and executor.capacity is None:
+    logger.warning("REPORT_STORAGE=local needs REPORT_EXECUTOR=local; ECS tasks cannot write this host's disk")
+PROCESS_STARTED = datetime.utcnow().isoformat() + 'Z'  # same format as TaskRecord.created_at
+HOST_ID = f"{socket.gethostname()}/{boot_id()}"  # hostname keeps containers sharing a kernel apart
+job_queue = JobQueue(dispatch_job, job_finished, on_failed=job_failed, recover=recover_lost_tasks,
+                     max_running=min(JOB_MAX_RUNNING, executor.capacity or JOB_MAX_RUNNING))
+
 # ────────────────────────────────────────────────────────────────────────────
 # Entrypoint
 # ────────────────────────────────────────────────────────────────────────────
@@ -0,0 +1,120 @@
+import os
+import json
+import logging
+import threading
+from typing import Optional
+import boto3
+from botocore.exceptions import ClientError
+
+from dynamo_config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "artifacts")
+
+
+class ArtifactRecord:
+    """A finished report: the exact object a task produced, so downloads never list the bucket."""
+
+    def __init__(self, item: dict):
+        self.task_id = item.get('TaskId')
+        self.bucket = item.get('bucket')
+        self.key = item.get('key')
+        self.size = int(item.get('size', 0))
+        self.output_format = item.get('outputFormat')
+        self.created_at = item.get('createdAt')
+
+    @classmethod
+    def from_head(cls, task_id: str, bucket: str, key: str, output_format: str, head: dict) -> "ArtifactRecord":
+        """Build a record from an S3 ``head_object`` response."""
+        return cls({
+            'TaskId': task_id,
+            'bucket': bucket,
+            'key': key,
+            'size': head['ContentLength'],
+            'outputFormat': output_format,
+            'createdAt': head['LastModified'].isoformat(),
+        })
+
+    def to_dict(self) -> dict:
+        """Convert artifact to DynamoDB item format."""
+        return {
+            'TaskId': self.task_id,
+            'bucket': self.bucket,
+            'key': self.key,
+            'size': self.size,
+            'outputFormat': self.output_format,
+            'createdAt': self.created_at,
+        }
+
+    def __repr__(self):
+        return f"<Artifact {self.task_id}:{self.key}:{self.size}>"
+
+
+class LocalArtifactIndex:
+    """Artifact index keeping one JSON file per task, for local development and tests."""
+
+    def __init__(self, directory: str = DEFAULT_ARTIFACTS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, task_id: str) -> str:
+        if not task_id.isalnum():
+            raise ValueError(f"Invalid task id {task_id!r}")
+        return os.path.join(self.directory, f"{task_id}.json")
+
+    def put(self, artifact: ArtifactRecord) -> ArtifactRecord:
+        path = self._path(artifact.task_id)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w') as f:
+                json.dump(artifact.to_dict(), f)
+            os.replace(tmp_path, path)
+        return artifact
+
+    def get(self, task_id: str) -> Optional[ArtifactRecord]:
+        try:
+            with open(self._path(task_id)) as f:
+                return ArtifactRecord(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+class DynamoArtifactIndex:
+    """Artifact index in DynamoDB, keyed by TaskId."""
+
+    def __init__(self):
+        try:
+            self.dynamodb = boto3.resource('dynamodb', **config.get_boto3_config())
+            self.table = self.dynamodb.Table(config.artifacts_table_name)
+        except Exception as e:
+            logger.error(f"Failed to initialize DynamoDB artifact table: {e}")
+            raise
+
+    def put(self, artifact: ArtifactRecord) -> ArtifactRecord:
+        try:
+            self.table.put_item(Item=artifact.to_dict())
+        except ClientError as e:
+            # The download path falls back to a keyed head_object, so this only costs speed
+            logger.error(f"Error indexing artifact for task {artifact.task_id}: {e}")
+        return artifact
+
+    def get(self, task_id: str) -> Optional[ArtifactRecord]:
+        try:
+            item = self.table.get_item(Key={'TaskId': task_id}).get('Item')
+            return ArtifactRecord(item) if item else None
+        except ClientError as e:
+            logger.error(f"Error getting artifact for task {task_id}: {e}")
+            return None
+
+
+def create_artifact_index():
+    """ARTIFACT_INDEX=local keeps the index on disk (ARTIFACT_INDEX_DIR); anything else uses DynamoDB."""
+    if os.getenv("ARTIFACT_INDEX", "dynamodb") == "local":
+        return LocalArtifactIndex(os.getenv("ARTIFACT_INDEX_DIR", DEFAULT_ARTIFACTS_DIR))
+    return DynamoArtifactIndex()
+
+
+# Global index instance
+artifact_index = create_artifact_index()
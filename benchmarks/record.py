@@ -0,0 +1,63 @@
+"""Record one participant's real cortex responses for offline replay.
+
+Makes the same calls as ``reports/bidmc/report_generator.py`` against the live
+server and pickles the results into ``--out``. Point the benchmark harness at
+that directory with ``--replay`` to time the generator on real data without a
+network. Recordings contain participant data; keep them out of git.
+
+Usage:
+    python benchmarks/record.py --participant_id U0123456789 --start_date 2024-01-01 --out recordings/U0123
+"""
+
+import os
+import sys
+import json
+import pickle
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'reports', 'bidmc'))
+
+import cortex  # noqa: E402
+from report_generator import (  # noqa: E402
+    MS_IN_DAY,
+    PASSIVE_FEATURES,
+    PASSIVE_FEATURE_PARAMS,
+    score_dict,
+    connect,
+    timestamp,
+)
+
+
+def save(out_dir, name, value):
+    with open(os.path.join(out_dir, f"{name}.pkl"), 'wb') as f:
+        pickle.dump(value, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record cortex responses for benchmark replay.")
+    parser.add_argument('--participant_id', required=True)
+    parser.add_argument('--start_date', required=True)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args(argv)
+
+    connect()
+    os.makedirs(args.out, exist_ok=True)
+    start, end = timestamp(args.start_date), cortex.now()
+
+    save(args.out, 'run', cortex.run(args.participant_id, PASSIVE_FEATURES,
+                                     feature_params=PASSIVE_FEATURE_PARAMS, start=start, end=end))
+    save(args.out, 'survey_scores', cortex.primary.survey_scores.survey_scores(
+        id=args.participant_id, start=start, end=end, return_ind_ques=1, scoring_dict=score_dict)['data'])
+    save(args.out, 'nearby_device_count', cortex.secondary.nearby_device_count.nearby_device_count(
+        id=args.participant_id, start=start, end=end, resolution=MS_IN_DAY)['data']['data'])
+    save(args.out, 'data_quality', cortex.secondary.data_quality.data_quality(
+        id=args.participant_id, start=end - 7 * MS_IN_DAY, end=end, resolution=MS_IN_DAY,
+        feature='accelerometer', bin_size=10000)['data'])
+    save(args.out, 'meta', {'start': start, 'end': end})
+    with open(os.path.join(args.out, 'meta.json'), 'w') as f:
+        json.dump({'start_date': args.start_date, 'start': start, 'end': end}, f)
+    print(f"[INFO] Recorded {args.participant_id} to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
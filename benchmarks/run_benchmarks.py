@@ -0,0 +1,158 @@
+"""Benchmark the report generator offline across study lengths.
+
+Each case runs ``reports/bidmc/report_generator.py`` in a fresh interpreter with
+the cortex/LAMP stand-in from ``benchmarks/stand_in`` first on PYTHONPATH, so no
+server or credentials are needed. Per run we keep the end-to-end wall time,
+the generator's own per-stage timings (``<output>.timings.json``), its peak RSS
+and the report size; the medians over ``--repeat`` runs go to ``--output``.
+
+Give ``--baseline`` a previous results file to fail (exit 1) when any case got
+slower, bigger or hungrier by more than ``--tolerance``.
+
+Usage:
+    python benchmarks/run_benchmarks.py --days 30 365 1095 --repeat 3 --output bench.json
+    python benchmarks/run_benchmarks.py --days 365 --step_samples_per_day 1440 --baseline bench.json
+    python benchmarks/run_benchmarks.py --replay recordings/U0123 --output replay.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GENERATOR = os.path.join(HERE, '..', 'reports', 'bidmc', 'report_generator.py')
+STAND_IN = os.path.join(HERE, 'stand_in')
+
+BENCH_NOW = 1748736000000  # 2025-06-01 UTC; matches the stand-in default
+
+# metrics compared against --baseline; higher is worse for all of them
+TRACKED = ('end_to_end_s', 'peak_rss_mb', 'output_bytes')
+
+
+def case_env(args, replay=None):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [STAND_IN, env.get('PYTHONPATH')]))
+    env.update({
+        'LAMP_ACCESS_KEY': 'bench', 'LAMP_SECRET_KEY': 'bench', 'LAMP_SERVER_ADDRESS': 'bench',
+        'BENCH_NOW': str(BENCH_NOW),
+        'BENCH_SURVEYS_PER_DAY': str(args.surveys_per_day),
+        'BENCH_STEP_SAMPLES_PER_DAY': str(args.step_samples_per_day),
+        'BENCH_LATENCY_MS': str(args.latency_ms),
+        'BENCH_LATENCY_MS_PER_DAY': str(args.latency_ms_per_day),
+        'BENCH_FAIL_RATE': str(args.fail_rate),
+    })
+    if replay:
+        env['BENCH_REPLAY_DIR'] = os.path.abspath(replay)
+    return env
+
+
+def run_once(start_date, output_format, env, work_dir):
+    output_path = os.path.join(work_dir, f"report.{output_format}")
+    cmd = [sys.executable, GENERATOR, '--participant_id', 'U_BENCH', '--start_date', start_date,
+           '--output_format', output_format, '--output_path', output_path, '--no_cache', '--no_store']
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"generator exited with {proc.returncode}:\n{proc.stderr[-2000:]}")
+    with open(os.path.splitext(output_path)[0] + '.timings.json') as f:
+        timings = json.load(f)
+    return {
+        'end_to_end_s': round(elapsed, 3),
+        'peak_rss_mb': timings['peak_rss_mb'],
+        'output_bytes': os.path.getsize(output_path),
+        'stages': {record['stage']: record['wall_s'] for record in timings['stages']},
+    }
+
+
+def run_case(name, start_date, args, env):
+    runs = []
+    for attempt in range(args.repeat):
+        with tempfile.TemporaryDirectory(prefix='lamp-bench-') as work_dir:
+            runs.append(run_once(start_date, args.output_format, env, work_dir))
+        print(f"[{name}] run {attempt + 1}/{args.repeat}: {runs[-1]['end_to_end_s']}s, "
+              f"{runs[-1]['peak_rss_mb']} MiB, {runs[-1]['output_bytes'] / 1024:.0f} KiB", flush=True)
+    stage_names = runs[0]['stages']
+    return {
+        'case': name,
+        'start_date': start_date,
+        'end_to_end_s': statistics.median(run['end_to_end_s'] for run in runs),
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+        'output_bytes': max(run['output_bytes'] for run in runs),
+        'stages': {stage: statistics.median(run['stages'].get(stage, 0) for run in runs)
+                   for stage in stage_names},
+    }
+
+
+def regressions(results, baseline, tolerance):
+    previous = {case['case']: case for case in baseline['cases']}
+    found = []
+    for case in results['cases']:
+        before = previous.get(case['case'])
+        if not before:
+            continue
+        for metric in TRACKED:
+            if before.get(metric) and case[metric] > before[metric] * (1 + tolerance):
+                found.append(f"{case['case']}: {metric} {before[metric]} -> {case[metric]}")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LAMP report generator on synthetic or replayed data.")
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365, 1095],
+                        help="Study lengths to generate synthetic participants for")
+    parser.add_argument('--surveys_per_day', type=int, default=1)
+    parser.add_argument('--step_samples_per_day', type=int, default=96)
+    parser.add_argument('--latency_ms', type=float, default=0, help="Simulated server latency per cortex call")
+    parser.add_argument('--latency_ms_per_day', type=float, default=0,
+                        help="Simulated latency per day of requested range")
+    parser.add_argument('--fail_rate', type=float, default=0, help="Probability a cortex call fails transiently")
+    parser.add_argument('--replay', help="Directory written by benchmarks/record.py (replaces --days)")
+    parser.add_argument('--output_format', choices=['html', 'pdf'], default='html')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--baseline', help="Previous results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    cases = []
+    if args.replay:
+        with open(os.path.join(args.replay, 'meta.json')) as f:
+            meta = json.load(f)
+        cases.append(run_case(f"replay:{os.path.basename(os.path.normpath(args.replay))}",
+                              meta['start_date'], args, case_env(args, replay=args.replay)))
+    else:
+        now = datetime.fromtimestamp(BENCH_NOW / 1000, tz=timezone.utc)
+        for days in args.days:
+            start_date = (now - timedelta(days=days)).strftime('%Y-%m-%d')
+            cases.append(run_case(f"{days}d", start_date, args, case_env(args)))
+
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'settings': {key: getattr(args, key) for key in
+                     ('surveys_per_day', 'step_samples_per_day', 'latency_ms', 'latency_ms_per_day',
+                      'fail_rate', 'output_format', 'repeat')},
+        'cases': cases,
+    }
+    print(json.dumps(cases, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"[REGRESSION] {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Offline stand-in for LAMP-core; the benchmark generator only needs ``connect``."""
+
+
+def connect(*args, **kwargs):
+    pass
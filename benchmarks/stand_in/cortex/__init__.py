@@ -0,0 +1,26 @@
+"""Offline stand-in for LAMP-cortex, used by the benchmark harness.
+
+Only the calls the report generators make are implemented. Data is synthetic
+and deterministic (see ``_bench``), or replayed from a directory written by
+``benchmarks/record.py`` when ``BENCH_REPLAY_DIR`` is set.
+"""
+
+from . import _bench
+# Reached as cortex.primary.* / cortex.secondary.*, like the real package
+from . import primary, secondary  # noqa: F401
+
+
+def now():
+    return _bench.now()
+
+
+def run(id, features, feature_params=None, start=None, end=None, **kwargs):
+    _bench.count_call('run', start, end)
+    broken = _bench.FAIL_FEATURES.intersection(features)
+    if broken:
+        raise RuntimeError(f"simulated failure computing {', '.join(sorted(broken))}")
+    if _bench.REPLAY_DIR:
+        recorded = _bench.load_recording('run')
+        return {feature: _bench.slice_frame(recorded[feature], start, end)
+                for feature in features if feature in recorded}
+    return {feature: _bench.passive_feature(id, feature, start, end) for feature in features}
@@ -0,0 +1,159 @@
+"""Synthetic data and replay for the cortex stand-in.
+
+Configuration comes from the environment so the harness can drive a generator
+subprocess without touching its command line:
+
+    BENCH_NOW                    "now" in ms (default 2025-06-01 UTC), so runs are reproducible
+    BENCH_SEED                   base random seed (default 0)
+    BENCH_SURVEYS_PER_DAY        scored responses per survey category per day (default 1)
+    BENCH_STEP_SAMPLES_PER_DAY   raw step_count rows per day (default 96)
+    BENCH_MISSING_DAYS           fraction of days with no passive data (default 0.1)
+    BENCH_LATENCY_MS             simulated server latency per call (default 0)
+    BENCH_LATENCY_MS_PER_DAY     extra latency per day of requested range (default 0)
+    BENCH_FAIL_RATE              probability that a call raises a transient error (default 0)
+    BENCH_FAIL_FEATURES          comma-separated cortex.run features that always fail
+    BENCH_REPLAY_DIR             serve recorded responses instead of synthetic data
+"""
+
+import os
+import sys
+import time
+import pickle
+import random
+import zlib
+
+import numpy as np
+import pandas as pd
+
+MS_IN_HOUR = 3600000
+MS_IN_DAY = 86400000
+
+NOW = int(os.getenv('BENCH_NOW', 1748736000000))
+SEED = int(os.getenv('BENCH_SEED', 0))
+SURVEYS_PER_DAY = int(os.getenv('BENCH_SURVEYS_PER_DAY', 1))
+STEP_SAMPLES_PER_DAY = int(os.getenv('BENCH_STEP_SAMPLES_PER_DAY', 96))
+MISSING_DAYS = float(os.getenv('BENCH_MISSING_DAYS', 0.1))
+LATENCY_MS = float(os.getenv('BENCH_LATENCY_MS', 0))
+LATENCY_MS_PER_DAY = float(os.getenv('BENCH_LATENCY_MS_PER_DAY', 0))
+FAIL_RATE = float(os.getenv('BENCH_FAIL_RATE', 0))
+FAIL_FEATURES = set(filter(None, os.getenv('BENCH_FAIL_FEATURES', '').split(',')))
+REPLAY_DIR = os.getenv('BENCH_REPLAY_DIR')
+
+SURVEY_CATEGORIES = ['Daily Mood Survey', 'Daily Anxiety Survey', 'Daily Function Survey', 'Daily SM Survey']
+
+_recordings = {}
+
+
+def now():
+    if REPLAY_DIR:
+        return load_recording('meta')['end']
+    return NOW
+
+
+def count_call(name, start=None, end=None):
+    """Log the call and simulate the server: latency, and transient failures."""
+    days = (end - start) / MS_IN_DAY if start is not None and end is not None else 0
+    latency = LATENCY_MS + LATENCY_MS_PER_DAY * days
+    if latency:
+        time.sleep(latency / 1000)
+    print(f"[BENCH] cortex.{name} ({days:.0f} days)", file=sys.stderr)
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        raise ConnectionError(f"simulated transient failure in cortex.{name}")
+
+
+def rng_for(*key):
+    """A generator seeded by ``key``. Data is keyed per day, so any split of a
+    date range into requests (cache resumes, time shards) sees the same values."""
+    return np.random.default_rng([SEED, zlib.crc32(repr(key).encode())])
+
+
+def day_starts(start, end):
+    """Day bins as cortex makes them: counted from ``start``, not from UTC midnight."""
+    return np.arange(start, end, MS_IN_DAY, dtype='int64')
+
+
+def present_days(participant_id, feature, start, end):
+    days = day_starts(start, end)
+    keep = [rng_for(participant_id, feature, 'missing', int(day)).random() >= MISSING_DAYS for day in days]
+    return days[np.array(keep, dtype=bool)]
+
+
+def daily_values(participant_id, feature, days):
+    make = DAILY_VALUES.get(feature, lambda rng, n: rng.random(n))
+    return np.array([make(rng_for(participant_id, feature, int(day)), 1)[0] for day in days], dtype=float)
+
+
+# per-day value generators for the daily secondary features
+DAILY_VALUES = {
+    'screen_duration': lambda rng, n: rng.gamma(4.0, 0.8, n) * MS_IN_HOUR,
+    'hometime': lambda rng, n: np.clip(rng.normal(15, 4, n), 0, 24) * MS_IN_HOUR,
+    'entropy': lambda rng, n: np.clip(rng.normal(1.2, 0.5, n), 0, None),
+    'data_quality': lambda rng, n: rng.beta(5, 2, n),
+    'nearby_device_count': lambda rng, n: rng.poisson(6, n).astype(float),
+}
+
+
+def passive_feature(participant_id, feature, start, end):
+    """A cortex.run-shaped frame for one feature: daily rows, or raw samples for steps."""
+    if feature == 'steps':
+        return raw_steps(participant_id, present_days(participant_id, feature, start, end))
+    # Secondary features have one row per day bin; days without data are NaN, not absent.
+    days = day_starts(start, end)
+    values = daily_values(participant_id, feature, days)
+    values[~np.isin(days, present_days(participant_id, feature, start, end))] = np.nan
+    return pd.DataFrame({'timestamp': pd.to_datetime(days, unit='ms'), 'value': values})
+
+
+def raw_steps(participant_id, days):
+    """Cumulative step_count samples through each day, as the phone reports them."""
+    per_day = STEP_SAMPLES_PER_DAY
+    offsets = np.empty((len(days), per_day), dtype='int64')
+    increments = np.empty((len(days), per_day), dtype='int64')
+    for row, day in enumerate(days):
+        rng = rng_for(participant_id, 'steps', int(day))
+        offsets[row] = np.sort(rng.integers(0, MS_IN_DAY, per_day))
+        increments[row] = rng.poisson(80, per_day)
+    frame = pd.DataFrame({
+        'timestamp': pd.to_datetime((days[:, None] + offsets).ravel(), unit='ms'),
+        'value': np.cumsum(increments, axis=1).ravel().astype(float),
+    })
+    frame['type'] = 'step_count'
+    return frame
+
+
+def survey_responses(participant_id, start, end):
+    """Scored survey answers in the shape of survey_scores(...)['data']."""
+    data = []
+    for day in present_days(participant_id, 'surveys', start, end):
+        rng = rng_for(participant_id, 'surveys', int(day))
+        for category in SURVEY_CATEGORIES:
+            top = 4 if category == 'Daily Function Survey' else 10
+            for _ in range(SURVEYS_PER_DAY):
+                finished = int(day + rng.integers(8, 23) * MS_IN_HOUR)
+                if not start <= finished < end:
+                    continue
+                data.append({'question': category, 'score': int(rng.integers(0, top + 1)),
+                             'start': finished - 60000, 'end': finished})
+    return data
+
+
+def daily_points(participant_id, feature, start, end, resolution=MS_IN_DAY):
+    days = np.arange(start, end, resolution, dtype='int64')
+    values = daily_values(participant_id, feature, days)
+    return [{'timestamp': int(t), 'value': float(v)} for t, v in zip(days, values)]
+
+
+def load_recording(name):
+    if name not in _recordings:
+        with open(os.path.join(REPLAY_DIR, f"{name}.pkl"), 'rb') as f:
+            _recordings[name] = pickle.load(f)
+    return _recordings[name]
+
+
+def slice_frame(frame, start, end):
+    timestamps = pd.to_datetime(frame['timestamp'])
+    return frame[(timestamps >= pd.to_datetime(start, unit='ms')) & (timestamps < pd.to_datetime(end, unit='ms'))]
+
+
+def slice_points(points, start, end, key='timestamp'):
+    return [point for point in points if start <= point[key] < end]
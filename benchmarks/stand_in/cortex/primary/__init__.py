@@ -0,0 +1 @@
+from . import survey_scores
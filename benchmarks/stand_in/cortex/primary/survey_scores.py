@@ -0,0 +1,8 @@
+from .. import _bench
+
+
+def survey_scores(id, start=None, end=None, return_ind_ques=0, scoring_dict=None, **kwargs):
+    _bench.count_call('primary.survey_scores', start, end)
+    if _bench.REPLAY_DIR:
+        return {'data': _bench.slice_points(_bench.load_recording('survey_scores'), start, end, key='end')}
+    return {'data': _bench.survey_responses(id, start, end)}
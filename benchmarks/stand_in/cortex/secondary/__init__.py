@@ -0,0 +1 @@
+from . import nearby_device_count, data_quality
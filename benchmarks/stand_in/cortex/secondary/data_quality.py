@@ -0,0 +1,8 @@
+from .. import _bench
+
+
+def data_quality(id, start=None, end=None, resolution=86400000, feature=None, bin_size=None, **kwargs):
+    _bench.count_call('secondary.data_quality', start, end)
+    if _bench.REPLAY_DIR:
+        return {'data': _bench.slice_points(_bench.load_recording('data_quality'), start, end)}
+    return {'data': _bench.daily_points(id, 'data_quality', start, end, resolution)}
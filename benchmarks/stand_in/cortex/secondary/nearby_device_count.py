@@ -0,0 +1,10 @@
+from .. import _bench
+
+
+def nearby_device_count(id, start=None, end=None, resolution=86400000, **kwargs):
+    _bench.count_call('secondary.nearby_device_count', start, end)
+    if _bench.REPLAY_DIR:
+        points = _bench.slice_points(_bench.load_recording('nearby_device_count'), start, end)
+    else:
+        points = _bench.daily_points(id, 'nearby_device_count', start, end, resolution)
+    return {'data': {'data': points}}
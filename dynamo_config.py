@@ -17,6 +17,8 @@ class DynamoConfig:
         
         # DynamoDB Settings
         self.table_name = os.getenv("DYNAMODB_TABLE_NAME", "dev-data-reports-users")
+        self.tasks_table_name = os.getenv("DYNAMODB_TASKS_TABLE_NAME", "dev-data-reports-tasks")
+        self.artifacts_table_name = os.getenv("DYNAMODB_ARTIFACTS_TABLE_NAME", "dev-data-reports-artifacts")
         self.endpoint_url = os.getenv("DYNAMODB_ENDPOINT_URL")  # For local development
         
         # Index names  
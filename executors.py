@@ -0,0 +1,153 @@
+import os
+import sys
+import logging
+import pathlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import boto3
+
+from parameter_store import parameter_store
+
+logger = logging.getLogger(__name__)
+
+REPORTS_ROOT = pathlib.Path(__file__).resolve().parent / "reports"
+
+# Reports the local executor runs at once; the job queue never asks for more.
+LOCAL_EXECUTOR_WORKERS = int(os.getenv("LOCAL_EXECUTOR_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+LOCAL_EXECUTOR_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 2 * 3600))
+
+
+def report_arguments(job) -> List[str]:
+    """Command-line arguments every report script takes."""
+    return [
+        '--participant_id', job.participant_id,
+        '--start_date', job.start_date,
+        '--output_format', job.output_format,
+        '--output_path', job.output_path,
+        '--progress_file', job.progress_file,
+    ]
+
+
+def report_environment(job) -> dict:
+    """LAMP credentials from Parameter Store, plus the task ID used for checkpoints."""
+    return {
+        'LAMP_ACCESS_KEY': parameter_store.get_parameter('LAMP_ACCESS_KEY'),
+        'LAMP_SECRET_KEY': parameter_store.get_parameter('LAMP_SECRET_KEY'),
+        'LAMP_SERVER_ADDRESS': parameter_store.get_parameter('LAMP_SERVER_ADDRESS'),
+        'TASK_ID': job.task_id,
+    }
+
+
+def resolve_script(report_id: str) -> pathlib.Path:
+    """``site/script.py`` -> the script under ``reports/``.
+
+    Report IDs name the UI entry; sites without that file are served by their
+    ``report_generator.py``, which is what the Fargate task runs.
+    """
+    site, script_name = report_id.split("/", 1)
+    site_dir = (REPORTS_ROOT / site).resolve()
+    if site_dir.parent != REPORTS_ROOT.resolve() or not site_dir.is_dir():
+        raise ValueError(f"Unknown report site {site!r}")
+    script = (site_dir / script_name).resolve()
+    if script.parent == site_dir and script.suffix == ".py" and script.is_file():
+        return script
+    fallback = site_dir / "report_generator.py"
+    if fallback.is_file():
+        return fallback
+    raise ValueError(f"No script for report {report_id!r}")
+
+
+class EcsExecutor:
+    """Runs each report as a Fargate task."""
+
+    capacity = None  # no local limit; the job queue's caps apply
+
+    def __init__(self, task_definition: str = os.getenv("ECS_TASK_DEFINITION", "lamp-data-reports-dev"),
+                 container_name: str = "data-reports"):
+        self.ecs_client = boto3.client('ecs')
+        self.task_definition = task_definition
+        self.container_name = container_name
+
+    def launch(self, job):
+        # Get ECS configuration
+        cluster_name = parameter_store.get_parameter('ECS_CLUSTER')
+        subnet_id = parameter_store.get_parameter('SUBNET_ID')
+        security_group_id = parameter_store.get_parameter('SECURITY_GROUP_ID')
+
+        response = self.ecs_client.run_task(
+            cluster=cluster_name,
+            taskDefinition=self.task_definition,
+            launchType='FARGATE',
+            networkConfiguration={
+                'awsvpcConfiguration': {
+                    'subnets': [subnet_id],
+                    'securityGroups': [security_group_id],
+                    'assignPublicIp': 'ENABLED'
+                }
+            },
+            overrides={
+                'containerOverrides': [
+                    {
+                        'name': self.container_name,
+                        'environment': [{'name': name, 'value': value}
+                                        for name, value in report_environment(job).items()],
+                        'command': report_arguments(job),
+                    }
+                ]
+            }
+        )
+        if response.get('failures'):
+            raise RuntimeError(f"ECS could not start the task: {response['failures']}")
+        logger.info(f"Started ECS task for report {job.report_id}, task_id: {job.task_id}")
+
+
+class LocalExecutor:
+    """Runs each report as a subprocess of this host, at most ``workers`` at a time.
+
+    No container to provision, so a small report finishes in seconds, and with
+    local storage the whole generate → progress → download loop runs offline.
+    Output of each run goes to ``<log_dir>/<task_id>.log``.
+    """
+
+    def __init__(self, log_dir: str, workers: int = LOCAL_EXECUTOR_WORKERS,
+                 on_exit: Optional[Callable[[object, int], None]] = None,
+                 python: str = sys.executable, timeout: float = LOCAL_EXECUTOR_TIMEOUT):
+        self.log_dir = log_dir
+        self.capacity = workers
+        self.on_exit = on_exit
+        self.python = python
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        os.makedirs(log_dir, exist_ok=True)
+
+    def launch(self, job):
+        script = resolve_script(job.report_id)
+        command = [self.python, str(script)] + report_arguments(job)
+        env = {**os.environ, **report_environment(job)}
+        self.pool.submit(self._run, job, command, env, script.parent)
+        logger.info(f"Started local run of {script.name} for report {job.report_id}, task_id: {job.task_id}")
+
+    def _run(self, job, command: List[str], env: dict, cwd: pathlib.Path):
+        log_path = os.path.join(self.log_dir, f"{job.task_id}.log")
+        try:
+            with open(log_path, 'w') as log:
+                returncode = subprocess.run(command, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT,
+                                            timeout=self.timeout).returncode
+        except subprocess.TimeoutExpired:
+            logger.error(f"Local report {job.task_id} timed out after {self.timeout:.0f}s")
+            returncode = -1
+        except Exception as e:
+            logger.error(f"Local report {job.task_id} could not run: {e}")
+            returncode = -1
+        if returncode != 0:
+            logger.error(f"Local report {job.task_id} exited with {returncode}; see {log_path}")
+        if self.on_exit:
+            self.on_exit(job, returncode)
+
+
+def create_executor(log_dir: str, on_exit: Optional[Callable[[object, int], None]] = None):
+    """REPORT_EXECUTOR=local runs reports on this host; anything else uses ECS."""
+    if os.getenv("REPORT_EXECUTOR", "ecs") == "local":
+        return LocalExecutor(log_dir, on_exit=on_exit)
+    return EcsExecutor()
@@ -0,0 +1,216 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Concurrency caps apply per web process (gunicorn runs one threaded worker by default).
+JOB_MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", 10))
+JOB_MAX_PER_SITE = int(os.getenv("JOB_MAX_PER_SITE", 4))
+# Seconds between dispatcher passes over running jobs.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2))
+# A job that never reports completion (container killed) frees its slot after this long.
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 2 * 3600))
+
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+class Job:
+    """One report run waiting for, or holding, an executor slot."""
+
+    def __init__(self, task_id: str, site: str, report_id: str, participant_id: str, start_date: str,
+                 output_format: str, output_path: str, progress_file: str, priority: str = "interactive"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}")
+        self.task_id = task_id
+        self.site = site
+        self.report_id = report_id
+        self.participant_id = participant_id
+        self.start_date = start_date
+        self.output_format = output_format
+        self.output_path = output_path
+        self.progress_file = progress_file
+        self.priority = priority
+        self.state = "queued"
+        self.queued_at = time.time()
+        self.started_at = None
+        self.accepted = threading.Event()  # set once submit has queued (or rejected) it
+
+    @property
+    def key(self) -> tuple:
+        """Requests with the same key produce the same report, so they share one job."""
+        return (self.report_id, self.participant_id, self.start_date, self.output_format)
+
+    def __repr__(self):
+        return f"<Job {self.task_id}:{self.report_id}:{self.participant_id}:{self.state}>"
+
+
+class JobQueue:
+    """Hands jobs to ``dispatch`` from a background thread, within concurrency caps.
+
+    ``submit`` returns at once. Interactive jobs are dispatched before bulk ones
+    and, within a priority, in arrival order. A job is running from ``dispatch``
+    until ``is_finished(job)`` says so (or ``timeout`` passes); identical
+    requests made meanwhile get the existing job back instead of a new one.
+
+    The queue lives in memory. ``recover``, if given, runs once on the
+    dispatcher thread before anything is dispatched, to settle the tasks a
+    previous process accepted and lost when it stopped.
+    """
+
+    def __init__(self, dispatch: Callable[[Job], None], is_finished: Callable[[Job], bool],
+                 on_failed: Optional[Callable[[Job, Exception], None]] = None,
+                 recover: Optional[Callable[[], None]] = None,
+                 max_running: int = JOB_MAX_RUNNING, max_per_site: int = JOB_MAX_PER_SITE,
+                 poll_interval: float = JOB_POLL_INTERVAL, timeout: float = JOB_TIMEOUT):
+        self.dispatch = dispatch
+        self.is_finished = is_finished
+        self.on_failed = on_failed
+        self.recover = recover
+        self.max_running = max_running
+        self.max_per_site = max_per_site
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._queued: List[tuple] = []  # heap of (priority, seq, job)
+        self._running: Dict[str, Job] = {}
+        self._in_flight: Dict[tuple, Job] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def submit(self, job: Job, on_accept: Optional[Callable[[Job], None]] = None) -> Job:
+        """Queue ``job``, or return the identical job already queued or running.
+
+        ``on_accept`` runs before a new job can be dispatched (e.g. to register
+        its task); if it raises, the job is not queued. It runs outside the
+        queue lock; identical requests made meanwhile wait for it to finish.
+        """
+        while True:
+            with self._lock:
+                existing = self._in_flight.get(job.key)
+                if existing is None:
+                    self._in_flight[job.key] = job
+                    break
+            existing.accepted.wait()
+            if existing.state != "rejected":
+                logger.info(f"Coalesced request for {job.key} onto task {existing.task_id}")
+                return existing
+
+        try:
+            if on_accept:
+                on_accept(job)
+        except BaseException:
+            with self._lock:
+                job.state = "rejected"
+                del self._in_flight[job.key]
+            job.accepted.set()
+            raise
+        with self._lock:
+            heapq.heappush(self._queued, (PRIORITIES[job.priority], self._seq, job))
+            self._seq += 1
+            self._ensure_started()
+        job.accepted.set()
+        self._wake.set()
+        return job
+
+    def start(self):
+        """Start the dispatcher (and so ``recover``) without waiting for the first submit."""
+        with self._lock:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        # Started lazily so the thread belongs to the serving process, not a pre-fork parent.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True, name="job-dispatcher")
+            self._thread.start()
+
+    def _site_running(self, site: str) -> int:
+        return sum(1 for job in self._running.values() if job.site == site)
+
+    def _next_dispatchable(self) -> Optional[Job]:
+        """Pop the first queued job whose site has a free slot; caller holds the lock."""
+        if len(self._running) >= self.max_running:
+            return None
+        skipped = []
+        job = None
+        while self._queued:
+            entry = heapq.heappop(self._queued)
+            if self._site_running(entry[2].site) < self.max_per_site:
+                job = entry[2]
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._queued, entry)
+        return job
+
+    def _reap(self):
+        """Free the slots of finished (or timed-out) jobs."""
+        with self._lock:
+            running = list(self._running.values())
+        for job in running:
+            try:
+                finished = self.is_finished(job)
+            except Exception as e:
+                logger.error(f"Could not check job {job.task_id}: {e}")
+                finished = False
+            if not finished and time.time() - job.started_at > self.timeout:
+                logger.warning(f"Job {job.task_id} timed out after {self.timeout:.0f}s; releasing its slot")
+                finished = True
+            if finished:
+                self._finish(job, "done")
+
+    def _finish(self, job: Job, state: str):
+        with self._lock:
+            job.state = state
+            self._running.pop(job.task_id, None)
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+
+    def _run(self):
+        if self.recover:
+            try:
+                self.recover()
+            except Exception as e:
+                logger.error(f"Job recovery failed: {e}")
+            self.recover = None  # once per process, even if the thread is restarted
+        while True:
+            self._wake.clear()
+            self._reap()
+            while True:
+                with self._lock:
+                    job = self._next_dispatchable()
+                    if job is None:
+                        break
+                    job.state = "running"
+                    job.started_at = time.time()
+                    self._running[job.task_id] = job
+                try:
+                    self.dispatch(job)
+                except Exception as e:
+                    logger.error(f"Failed to dispatch job {job.task_id}: {e}")
+                    self._finish(job, "failed")
+                    if self.on_failed:
+                        self.on_failed(job, e)
+            self._wake.wait(self.poll_interval)
+
+    def position(self, task_id: str) -> Optional[int]:
+        """Number of queued jobs ahead of ``task_id``, or None if it is not queued."""
+        with self._lock:
+            order = sorted(self._queued, key=lambda entry: entry[:2])
+        for index, entry in enumerate(order):
+            if entry[2].task_id == task_id:
+                return index
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'queued': len(self._queued),
+                'running': len(self._running),
+                'running_by_site': {site: self._site_running(site)
+                                    for site in {job.site for job in self._running.values()}},
+            }
@@ -1,36 +1,172 @@
-"""Parameter Store helper for retrieving configuration values."""
+"""Parameter Store helper for retrieving configuration values.
+
+Every parameter under ``/env/{ENVIRONMENT}/data-reports/`` is loaded with one
+(paginated) GetParametersByPath call on the first lookup, not at import, and
+reloaded in the background every PARAMETER_TTL seconds, so rotated secrets are
+picked up without a restart. A name the load did not return is remembered as missing
+until the next reload and served from the environment instead.
+
+When SSM cannot be reached (no network or credentials, as in local development)
+lookups skip it for PARAMETER_RETRY_S seconds and use the environment, rather
+than each waiting out its own timeouts. PARAMETER_SOURCE=env never calls SSM.
+"""
 
 import os
+import time
+import threading
 import boto3
-from functools import lru_cache
 import logging
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger(__name__)
 
+PARAMETER_TTL = float(os.getenv("PARAMETER_TTL", 300))
+PARAMETER_RETRY_S = float(os.getenv("PARAMETER_RETRY_S", 30))
+PARAMETER_SOURCE = os.getenv("PARAMETER_SOURCE", "ssm")
+
+# Fail fast: a lookup runs on a request thread
+SSM_CONFIG = Config(connect_timeout=2, read_timeout=5, retries={'max_attempts': 2, 'mode': 'standard'})
+
 class ParameterStore:
-    def __init__(self):
-        self.ssm = boto3.client('ssm')
+    def __init__(self, ttl: float = PARAMETER_TTL, source: str = PARAMETER_SOURCE,
+                 retry_after: float = PARAMETER_RETRY_S):
+        self.ssm = boto3.client('ssm', config=SSM_CONFIG) if source == "ssm" else None
         self.environment = os.getenv('ENVIRONMENT', 'dev')
-    
-    @lru_cache(maxsize=100)
-    def get_parameter(self, name: str, default: str = None) -> str:
-        """Get parameter from Parameter Store with caching."""
+        self.path = f"/env/{self.environment}/data-reports/"
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._unreachable_until = 0.0  # monotonic time before which SSM is not tried
+        self._values = {}
+        self._missing = {}  # name -> monotonic time until which it is known to be absent
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._load_attempted = False
+        self._refresher = None
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def refresh(self) -> bool:
+        """Reload the whole parameter path; on failure the previous values stay in use."""
+        values = {}
         try:
-            # Try Parameter Store first using your existing structure
-            parameter_name = f"/env/{self.environment}/data-reports/{name}"
-            response = self.ssm.get_parameter(Name=parameter_name, WithDecryption=True)
-            return response['Parameter']['Value']
-        except self.ssm.exceptions.ParameterNotFound:
-            logger.warning(f"Parameter not found: {parameter_name}")
+            paginator = self.ssm.get_paginator('get_parameters_by_path')
+            for page in paginator.paginate(Path=self.path, Recursive=True, WithDecryption=True):
+                for parameter in page['Parameters']:
+                    values[parameter['Name'][len(self.path):]] = parameter['Value']
         except Exception as e:
-            logger.error(f"Error retrieving parameter {parameter_name}: {e}")
-        
+            logger.error(f"Error loading parameters under {self.path}: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+            self._note_error(e)
+            return False
+
+        with self._lock:
+            self._values = values
+            self._missing.clear()
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+        return True
+
+    def _note_error(self, error: Exception):
+        # A ClientError (e.g. AccessDenied on the path) means SSM answered; anything
+        # else (no credentials, timeouts) would make every lookup wait the same way.
+        if not isinstance(error, ClientError):
+            self._unreachable_until = time.monotonic() + self.retry_after
+
+    def _ensure_loaded(self):
+        # Loaded on first use so importing the app needs neither SSM nor credentials.
+        if self._load_attempted:
+            return
+        with self._load_lock:
+            if not self._load_attempted:
+                self.refresh()
+                self._load_attempted = True
+
+    def _ensure_refresher(self):
+        # Started on first use so the thread belongs to the serving (post-fork) process.
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True,
+                                               name="parameter-refresh")
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.ttl)
+            self.refresh()
+
+    def _lookup(self, name: str):
+        """Return (found, value) from the cache or, if the bulk load never succeeded, SSM."""
+        if self.ssm is None:
+            return False, None
+        self._ensure_loaded()
+        with self._lock:
+            self._ensure_refresher()
+            if name in self._values:
+                self.hits += 1
+                return True, self._values[name]
+            now = time.monotonic()
+            if self._missing.get(name, 0) > now:
+                self.negative_hits += 1
+                return False, None
+            self.misses += 1
+            loaded = self._loaded_at is not None
+            if not loaded and self._unreachable_until > now:
+                return False, None
+
+        parameter_name = f"{self.path}{name}"
+        if loaded:
+            # The last load returned the whole path, so the name does not exist
+            logger.warning(f"Parameter not found: {parameter_name}")
+        else:
+            try:
+                response = self.ssm.get_parameter(Name=parameter_name, WithDecryption=True)
+                value = response['Parameter']['Value']
+                with self._lock:
+                    self._values[name] = value
+                return True, value
+            except self.ssm.exceptions.ParameterNotFound:
+                logger.warning(f"Parameter not found: {parameter_name}")
+            except Exception as e:
+                # Not cached as missing: a transient error should not hide the parameter for a whole TTL
+                logger.error(f"Error retrieving parameter {parameter_name}: {e}")
+                self._note_error(e)
+                return False, None
+
+        with self._lock:
+            self._missing[name] = now + self.ttl
+        return False, None
+
+    def get_parameter(self, name: str, default: str = None) -> str:
+        """Get parameter from the cached Parameter Store path, falling back to the environment."""
+        found, value = self._lookup(name)
+        if found:
+            return value
+
         # Fall back to environment variable
         env_value = os.getenv(name, default)
         if env_value is None:
             raise ValueError(f"Parameter {name} not found in Parameter Store or environment")
-        
+
         return env_value
 
+    def stats(self) -> dict:
+        """Cache counters: hits, misses (lookups not answered by the cache), negative hits, reloads."""
+        with self._lock:
+            return {
+                'parameters': len(self._values),
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'source': 'ssm' if self.ssm is not None else 'env',
+                'age_s': round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            }
+
 # Global instance
-parameter_store = ParameterStore()
\ No newline at end of file
+parameter_store = ParameterStore()
@@ -0,0 +1,113 @@
+import os
+import json
+import queue
+import logging
+import threading
+from typing import Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Seconds between upstream reads of one task's progress, however many viewers it has.
+POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", 2))
+# Comment lines keep idle connections open through proxies and load balancers.
+KEEPALIVE_INTERVAL = float(os.getenv("PROGRESS_KEEPALIVE_INTERVAL", 15))
+
+
+def is_final(payload: dict) -> bool:
+    value = payload.get('progress', 0)
+    return value >= 100 or value < 0
+
+
+class _TaskChannel:
+    """One task's poller thread and the queues of everyone watching it."""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.subscribers = set()
+        self.last = None
+        self.stopped = threading.Event()
+
+
+class ProgressStream:
+    """Fans progress out to Server-Sent Events viewers with one upstream poller per task.
+
+    ``read(task)`` fetches the task's current progress dict; it is called by a
+    background thread every ``interval`` seconds while the task has at least one
+    viewer, and stops once the task is finished or nobody is watching. Backend
+    calls therefore scale with active tasks, not viewers × poll rate. Channels
+    are per process, so each gunicorn worker polls a task it serves at most once.
+    """
+
+    def __init__(self, read: Callable[[object], dict], interval: float = POLL_INTERVAL,
+                 keepalive: float = KEEPALIVE_INTERVAL):
+        self.read = read
+        self.interval = interval
+        self.keepalive = keepalive
+        self._channels: Dict[str, _TaskChannel] = {}
+        self._lock = threading.Lock()
+        self.upstream_reads = 0
+
+    def _subscribe(self, task) -> "tuple[_TaskChannel, queue.Queue]":
+        updates = queue.Queue()
+        with self._lock:
+            channel = self._channels.get(task.task_id)
+            start = channel is None
+            if start:
+                channel = self._channels[task.task_id] = _TaskChannel(task.task_id)
+            channel.subscribers.add(updates)
+            if channel.last is not None:
+                updates.put(channel.last)
+        if start:
+            threading.Thread(target=self._poll, args=(task, channel), daemon=True,
+                             name=f"progress-{task.task_id}").start()
+        return channel, updates
+
+    def _unsubscribe(self, channel: _TaskChannel, updates: queue.Queue):
+        with self._lock:
+            channel.subscribers.discard(updates)
+            if not channel.subscribers:
+                channel.stopped.set()
+                if self._channels.get(channel.task_id) is channel:
+                    del self._channels[channel.task_id]
+
+    def _poll(self, task, channel: _TaskChannel):
+        while not channel.stopped.is_set():
+            try:
+                payload = self.read(task)
+                self.upstream_reads += 1
+            except Exception as e:
+                logger.error(f"Progress poll error for task {task.task_id}: {e}")
+                payload = None
+            if payload is not None and payload != channel.last:
+                with self._lock:
+                    channel.last = payload
+                    for updates in channel.subscribers:
+                        updates.put(payload)
+                if is_final(payload):
+                    with self._lock:
+                        if self._channels.get(channel.task_id) is channel:
+                            del self._channels[channel.task_id]
+                    return
+            channel.stopped.wait(self.interval)
+
+    def events(self, task) -> Iterator[str]:
+        """Yield SSE frames for ``task`` until it finishes or the viewer disconnects."""
+        channel, updates = self._subscribe(task)
+        try:
+            while True:
+                try:
+                    payload = updates.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+                if is_final(payload):
+                    return
+        finally:
+            # Runs when the client disconnects too (the WSGI server closes the generator)
+            self._unsubscribe(channel, updates)
+
+    @property
+    def active_tasks(self) -> int:
+        with self._lock:
+            return len(self._channels)
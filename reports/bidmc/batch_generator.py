@@ -0,0 +1,220 @@
+"""Generate reports for many participants in one process.
+
+Heavy imports and ``LAMP.connect()`` happen once in the parent; each
+participant's report then runs in its own forked child, at most ``--workers``
+at a time, so every report inherits the warm interpreter instead of paying a
+cold container start, and a child that dies (e.g. OOM-killed) fails only its
+own report.
+
+Participants come from ``--participants ID:YYYY-MM-DD ...`` and/or a CSV
+``--participants_file`` with ``participant_id,start_date`` columns. Each report
+is written to ``<output_dir>/<participant_id>.<format>`` with its own progress
+file next to it; overall progress goes to ``--progress_file`` and a per-participant
+summary to ``<output_dir>/batch_summary.json``.
+
+Usage:
+    python batch_generator.py --participants_file cohort.csv --output_dir out/ \
+        --output_format html --workers 4
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import argparse
+from datetime import datetime
+
+from report_generator import (
+    connect,
+    generate_report,
+    add_storage_arguments,
+    storage_from_args,
+)
+from progress_sink import open_progress
+
+# Set in each child by _init_worker (inherited through fork, never pickled).
+_storage = (None, None)
+
+# Longest error message a child reports back; keeps its result within one pipe buffer.
+MAX_ERROR_CHARS = 2000
+
+
+def parse_participant(value: str):
+    """Parse ``ID:YYYY-MM-DD`` into (participant_id, start_date)."""
+    participant_id, sep, start_date = value.rpartition(':')
+    if not sep or not participant_id:
+        raise argparse.ArgumentTypeError(f"Expected PARTICIPANT_ID:YYYY-MM-DD, got {value!r}")
+    datetime.strptime(start_date, '%Y-%m-%d')
+    return participant_id, start_date
+
+
+def read_participants_file(path: str):
+    """Read (participant_id, start_date) pairs from a CSV with a header row."""
+    participants = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            participant_id = (row.get('participant_id') or '').strip()
+            start_date = (row.get('start_date') or '').strip()
+            if not participant_id or participant_id.startswith('#'):
+                continue
+            datetime.strptime(start_date, '%Y-%m-%d')
+            participants.append((participant_id, start_date))
+    return participants
+
+
+def _init_worker(storage, output_format='html'):
+    global _storage
+    _storage = storage
+    if output_format == 'pdf':
+        # Start kaleido before the report so its startup fails (or is timed) on its own.
+        from pdf_renderer import get_renderer
+        try:
+            get_renderer().warm()
+        except RuntimeError as e:
+            # Leave it to run_job so the failure lands in the report's summary entry.
+            print(f"[WARN] {e}", file=sys.stderr)
+
+
+def run_job(job: dict) -> dict:
+    """Generate one participant's report; failures are returned, not raised."""
+    feature_cache, feature_store = _storage
+    started = time.time()
+    result = {'participant_id': job['participant_id'], 'output_path': job['output_path']}
+    progress = open_progress(job['progress_file'])
+    try:
+        generate_report(job['participant_id'], job['start_date'], job['output_format'],
+                        job['output_path'], progress=progress,
+                        feature_cache=feature_cache, feature_store=feature_store)
+        result['status'] = 'done'
+    except Exception as e:
+        progress.update(-1, f"Failed: {e}")
+        result['status'] = 'failed'
+        result['error'] = str(e)[:MAX_ERROR_CHARS]
+    result['seconds'] = round(time.time() - started, 2)
+    return result
+
+
+def build_jobs(participants, output_dir: str, output_format: str):
+    return [
+        {
+            'participant_id': participant_id,
+            'start_date': start_date,
+            'output_format': output_format,
+            'output_path': os.path.join(output_dir, f"{participant_id}.{output_format}"),
+            'progress_file': os.path.join(output_dir, f"{participant_id}.progress.json"),
+        }
+        for participant_id, start_date in participants
+    ]
+
+
+def fork_job(job: dict, storage, output_format: str):
+    """Run ``job`` in a forked child; return its pid and the pipe its result arrives on."""
+    read_fd, write_fd = os.pipe()
+    # Flush first so the child does not repeat the parent's buffered output
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(read_fd)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _init_worker(storage, output_format)
+            os.write(write_fd, json.dumps(run_job(job)).encode('utf-8'))
+            code = 0
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    os.close(write_fd)
+    return pid, read_fd
+
+
+def collect_result(job: dict, read_fd: int, status: int, started: float) -> dict:
+    """The child's result, or a failure if it died before writing one."""
+    chunks = []
+    while chunk := os.read(read_fd, 65536):
+        chunks.append(chunk)
+    os.close(read_fd)
+    if chunks:
+        return json.loads(b''.join(chunks))
+    code = os.waitstatus_to_exitcode(status)
+    reason = f"killed by signal {-code}" if code < 0 else f"exit code {code}"
+    return {'participant_id': job['participant_id'], 'output_path': job['output_path'], 'status': 'failed',
+            'error': f"worker crashed ({reason})", 'seconds': round(time.time() - started, 2)}
+
+
+def run_batch(jobs, workers: int, storage=(None, None), progress_file=None, output_format='html'):
+    """Run ``jobs`` in forked children, at most ``workers`` at once, and return their results."""
+    results = []
+    total = len(jobs)
+    progress = open_progress(progress_file)
+    progress.update(0, "Generating reports", finished=0, total=total)
+    pending = list(reversed(jobs))
+    children = {}  # pid -> (job, read_fd, started)
+    while pending or children:
+        while pending and len(children) < workers:
+            job = pending.pop()
+            pid, read_fd = fork_job(job, storage, output_format)
+            children[pid] = (job, read_fd, time.time())
+        # Results are small, so a child's write never blocks on the pipe before it exits
+        pid, status = os.waitpid(-1, 0)
+        if pid not in children:
+            continue
+        job, read_fd, started = children.pop(pid)
+        result = collect_result(job, read_fd, status, started)
+        results.append(result)
+        done = len(results)
+        state = result['status'] if result['status'] == 'done' else f"FAILED ({result.get('error')})"
+        print(f"[{done}/{total}] {result['participant_id']}: {state} in {result['seconds']}s", flush=True)
+        # Same message throughout, so a large batch is written at the throttle interval.
+        progress.update(int(done * 100 / total), "Generating reports", finished=done, total=total)
+    progress.flush()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate LAMP reports for many participants.")
+    parser.add_argument('--participants', nargs='*', type=parse_participant, default=[],
+                        metavar='ID:YYYY-MM-DD')
+    parser.add_argument('--participants_file', help="CSV with participant_id,start_date columns")
+    parser.add_argument('--output_format', choices=['html', 'pdf'], default='html')
+    parser.add_argument('--output_dir', required=True)
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--progress_file', required=False, help="Path to write overall batch progress")
+    add_storage_arguments(parser)
+    args = parser.parse_args(argv)
+
+    participants = list(args.participants)
+    if args.participants_file:
+        participants.extend(read_participants_file(args.participants_file))
+    if not participants:
+        parser.error("no participants given; use --participants and/or --participants_file")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    connect()
+
+    jobs = build_jobs(participants, args.output_dir, args.output_format)
+    started = time.time()
+    results = run_batch(jobs, max(1, args.workers), storage=storage_from_args(args),
+                        progress_file=args.progress_file, output_format=args.output_format)
+
+    failed = [r for r in results if r['status'] != 'done']
+    summary = {
+        'total': len(results),
+        'failed': len(failed),
+        'seconds': round(time.time() - started, 2),
+        'reports': sorted(results, key=lambda r: r['participant_id']),
+    }
+    with open(os.path.join(args.output_dir, 'batch_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"[INFO] {len(results) - len(failed)}/{len(results)} reports generated in {summary['seconds']}s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Calendar heatmap rendering for the report generators.
+
+Each metric is drawn with calplot exactly once and encoded as an inline PNG.
+The renders are CPU bound and independent, so ``render_calendars`` spreads
+them over a process pool. Workers come from a forkserver that has this module
+preloaded, so they start without re-importing matplotlib, and the fork does
+not inherit the generator's live pull threads.
+"""
+
+import io
+import os
+import sys
+import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+import matplotlib.pyplot as plt
+import calplot
+
+
+def fig_to_html(fig):
+    """Convert a Matplotlib figure to a base64-encoded HTML image tag."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    buf.seek(0)
+    encoded_fig = base64.b64encode(buf.read()).decode("utf-8")
+    buf.close()
+    return f'<img src="data:image/png;base64,{encoded_fig}">'
+
+
+def render_calendar(series):
+    """Render one date-indexed Series as a calendar heatmap image tag."""
+    fig_cal, _ = calplot.calplot(series, textfiller='-', dropzero=True)
+    try:
+        return fig_to_html(fig_cal)
+    finally:
+        plt.close(fig_cal)
+
+
+def _init_worker():
+    matplotlib.use('Agg')
+
+
+def render_calendars(calendar_data: dict, max_workers: int = None, isolate: bool = False) -> dict:
+    """Render {metric: Series} to {metric: image tag}, one process per metric up to ``max_workers``.
+
+    With ``isolate`` the renders always happen in worker processes, even with
+    one CPU, so matplotlib's memory is never allocated in the caller.
+    """
+    if not calendar_data:
+        return {}
+    if max_workers is None:
+        max_workers = min(len(calendar_data), os.cpu_count() or 1)
+    if not isolate and (max_workers <= 1 or len(calendar_data) <= 1):
+        return {metric: render_calendar(series) for metric, series in calendar_data.items()}
+    max_workers = max(1, max_workers)
+
+    try:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker)
+    except (OSError, RuntimeError, AssertionError) as e:
+        return _render_serially(calendar_data, e)
+
+    with pool:
+        try:
+            futures = {metric: pool.submit(render_calendar, series)
+                       for metric, series in calendar_data.items()}
+            return {metric: future.result() for metric, future in futures.items()}
+        except (OSError, RuntimeError, AssertionError, BrokenProcessPool) as e:
+            # Workers are started by the first submit; a daemonic caller may not have children
+            return _render_serially(calendar_data, e)
+
+
+def _render_serially(calendar_data: dict, error: Exception) -> dict:
+    # e.g. no /dev/shm, process limits in a restricted sandbox, or a daemonic caller
+    print(f"[WARN] Calendar process pool unavailable ({error}); rendering serially", file=sys.stderr)
+    return {metric: render_calendar(series) for metric, series in calendar_data.items()}
@@ -0,0 +1,242 @@
+"""Stage checkpoints so a retried report task resumes where the last one died.
+
+Outputs of stages marked ``checkpoint=True`` are pickled under
+``<location>/<task_id>/<stage>.pkl`` as soon as the stage finishes, and a small
+manifest records which stages are done. When the same task ID runs again with
+the same report arguments, ``run_stages`` restores those outputs and only runs
+what is still missing. The checkpoints are deleted once the report is written.
+
+The pickles hold raw participant data, so checkpointing is opt-in (the
+generator's ``--checkpoint_dir``), and checkpoints of tasks that were never
+resumed are removed after REPORT_CHECKPOINT_TTL_HOURS (default 24) by the next
+task that opens the same location. A task's checkpoints are expired together,
+by the age of its newest object, and a stage whose pickle has gone missing
+(e.g. to a lifecycle rule) is treated as not done and runs again. ``location`` is a local directory or an
+``s3://bucket/prefix`` URL (Fargate task storage does not survive a retry);
+on S3, also give the prefix a lifecycle rule that expires its objects.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+
+try:
+    import boto3
+    HAVE_BOTO3 = True
+except ImportError:
+    HAVE_BOTO3 = False
+
+CHECKPOINT_TTL = float(os.getenv("REPORT_CHECKPOINT_TTL_HOURS", 24)) * 3600
+
+MANIFEST = 'manifest.json'
+
+
+class LocalCheckpointStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def list(self, prefix: str):
+        """Names of the objects directly under ``prefix``."""
+        try:
+            return os.listdir(self._path(prefix))
+        except FileNotFoundError:
+            return []
+
+    def delete_prefix(self, prefix: str):
+        directory = self._path(prefix)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    def expire(self, max_age: float):
+        """Delete every task whose checkpoints were last written more than ``max_age`` seconds ago."""
+        if not os.path.isdir(self.root):
+            return
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.root):
+            directory = self._path(name)
+            if not os.path.isdir(directory):
+                continue
+            written = [os.path.getmtime(os.path.join(directory, entry)) for entry in os.listdir(directory)]
+            if max(written, default=os.path.getmtime(directory)) < cutoff:
+                self.delete_prefix(name)
+
+
+class S3CheckpointStore:
+    def __init__(self, url: str):
+        if not HAVE_BOTO3:
+            raise RuntimeError("boto3 is required for s3:// checkpoint locations")
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client('s3')
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def _objects(self, prefix: str):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def list(self, prefix: str):
+        """Names of the objects directly under ``prefix``."""
+        key_prefix = self._key(prefix) + '/'
+        return [obj['Key'][len(key_prefix):] for obj in self._objects(key_prefix)]
+
+    def delete_prefix(self, prefix: str):
+        keys = [{'Key': obj['Key']} for obj in self._objects(self._key(prefix) + '/')]
+        for start in range(0, len(keys), 1000):  # delete_objects takes at most 1000 keys
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys[start:start + 1000]})
+
+    def expire(self, max_age: float):
+        """Delete every task whose checkpoints were last written more than ``max_age`` seconds ago.
+
+        Tasks go as a whole, judged by their newest object (the manifest is
+        rewritten on every save), so no manifest outlives the stages it lists.
+        """
+        cutoff = time.time() - max_age
+        prefix = self.prefix + '/' if self.prefix else ''
+        written = {}  # task id -> newest LastModified
+        for obj in self._objects(prefix):
+            task_id, sep, _ = obj['Key'][len(prefix):].partition('/')
+            if sep:
+                written[task_id] = max(written.get(task_id, 0), obj['LastModified'].timestamp())
+        for task_id, last_written in written.items():
+            if last_written < cutoff:
+                self.delete_prefix(task_id)
+
+
+def checkpoint_store(location: str):
+    if location.startswith('s3://'):
+        return S3CheckpointStore(location)
+    return LocalCheckpointStore(location)
+
+
+class StageCheckpoint:
+    """Checkpoints for one report task, passed to ``run_stages(checkpoint=...)``."""
+
+    def __init__(self, location: str, task_id: str, ttl: float = CHECKPOINT_TTL):
+        self.store = checkpoint_store(location)
+        self.task_id = task_id
+        self.ttl = ttl
+        self.completed = set()
+        self.seed = {}
+        self.fingerprint = None
+        self.carriers = {}  # stage name -> callable returning JSON state saved with that stage
+        self.state = {}  # stage name -> state saved with its checkpoint
+
+    def open(self, fingerprint: dict, seed: dict) -> dict:
+        """Load the previous attempt's manifest and return the run seed to use.
+
+        ``fingerprint`` identifies the report (participant, dates, format); a
+        manifest written for different arguments is discarded. ``seed`` holds
+        values fixed at the first attempt, such as the end timestamp, so the
+        restored pulls and the fresh stages describe the same window.
+        """
+        self.fingerprint = fingerprint
+        self.seed = dict(seed)
+        try:
+            # Tasks that failed for good are never resumed; drop what they left behind
+            self.store.expire(self.ttl)
+        except Exception as e:
+            print(f"[WARN] Could not expire old checkpoints: {e}", file=sys.stderr)
+        try:
+            raw = self.store.get(f"{self.task_id}/{MANIFEST}")
+            manifest = json.loads(raw) if raw else None
+        except Exception as e:
+            print(f"[WARN] Could not read checkpoints for task {self.task_id}: {e}", file=sys.stderr)
+            manifest = None
+        if manifest and manifest.get('fingerprint') == fingerprint:
+            self.completed = set(manifest['stages'])
+            self.seed = manifest['seed']
+            self._drop_missing()
+            self.state = {name: state for name, state in manifest.get('state', {}).items()
+                          if name in self.completed}
+            print(f"[INFO] Resuming task {self.task_id}; checkpointed stages: "
+                  f"{', '.join(sorted(self.completed)) or 'none'}", file=sys.stderr)
+        elif manifest:
+            print(f"[WARN] Checkpoints for task {self.task_id} belong to a different report; ignoring them",
+                  file=sys.stderr)
+            self.clear()
+        return self.seed
+
+    def _drop_missing(self):
+        # The manifest can outlive a stage's pickle (a lifecycle rule, a partial cleanup)
+        try:
+            stored = {name[:-len('.pkl')] for name in self.store.list(self.task_id) if name.endswith('.pkl')}
+        except Exception as e:
+            print(f"[WARN] Could not list checkpoints for task {self.task_id}: {e}", file=sys.stderr)
+            stored = set()
+        missing = self.completed - stored
+        if missing:
+            print(f"[WARN] Checkpoints of {', '.join(sorted(missing))} are gone; those stages run again",
+                  file=sys.stderr)
+            self.completed -= missing
+
+    def carry(self, stage_name: str, snapshot):
+        """Save ``snapshot()`` (JSON-serializable) with ``stage_name``'s checkpoint; see ``carried``."""
+        self.carriers[stage_name] = snapshot
+
+    def carried(self, stage_name: str) -> dict:
+        """The state carried with ``stage_name``'s checkpoint by an earlier attempt, or {}."""
+        return self.state.get(stage_name, {})
+
+    def load(self, stage_name: str) -> dict:
+        data = self.store.get(f"{self.task_id}/{stage_name}.pkl")
+        if data is None:
+            raise RuntimeError(f"Checkpoint of stage {stage_name} for task {self.task_id} disappeared")
+        return pickle.loads(data)
+
+    def save(self, stage_name: str, outputs: dict):
+        """Persist one stage's outputs; a failed save only costs the resume, never the report."""
+        try:
+            self.store.put(f"{self.task_id}/{stage_name}.pkl",
+                           pickle.dumps(outputs, protocol=pickle.HIGHEST_PROTOCOL))
+            if stage_name in self.carriers:
+                self.state[stage_name] = self.carriers[stage_name]()
+            self.completed.add(stage_name)
+            manifest = {'fingerprint': self.fingerprint, 'seed': self.seed, 'stages': sorted(self.completed),
+                        'state': self.state}
+            self.store.put(f"{self.task_id}/{MANIFEST}", json.dumps(manifest).encode('utf-8'))
+        except Exception as e:
+            print(f"[WARN] Could not checkpoint {stage_name}: {e}", file=sys.stderr)
+
+    def clear(self):
+        try:
+            self.store.delete_prefix(self.task_id)
+        except Exception as e:
+            print(f"[WARN] Could not delete checkpoints for task {self.task_id}: {e}", file=sys.stderr)
+        self.completed = set()
+        self.state = {}
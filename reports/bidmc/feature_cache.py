@@ -0,0 +1,122 @@
+"""Incremental on-disk cache of cortex feature pulls.
+
+Results are stored per participant, feature and feature_params. A re-run only
+asks cortex for the days after the last cached day, plus a small overlap
+window so late-arriving data for recent days replaces what was cached.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MS_IN_DAY = 86400000
+DEFAULT_OVERLAP_DAYS = 3
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "lamp-reports", "features")
+
+
+def timestamps_ms(frame: pd.DataFrame) -> pd.Series:
+    """Return ``frame['timestamp']`` as epoch milliseconds, whether stored as datetimes or ints."""
+    ts = frame['timestamp']
+    if pd.api.types.is_datetime64_any_dtype(ts):
+        if getattr(ts.dt, 'tz', None) is not None:
+            ts = ts.dt.tz_convert('UTC').dt.tz_localize(None)
+        return ts.astype('int64') // 10**6
+    return ts.astype('int64')
+
+
+class FeatureCache:
+    """Cache of daily cortex results keyed by participant, feature and feature_params.
+
+    Each entry records the ``start``/``end`` window it covers, so sparse
+    features (days with no rows) are not refetched every run. Day bins are
+    anchored at the cached ``start``; a request whose start is not a whole
+    number of days after it falls back to a full pull and replaces the entry.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, overlap_days: int = DEFAULT_OVERLAP_DAYS):
+        self.root = root
+        self.overlap_days = overlap_days
+
+    def _path(self, participant_id: str, feature: str, params: dict) -> str:
+        digest = hashlib.sha1(json.dumps(params or {}, sort_keys=True).encode()).hexdigest()[:12]
+        return os.path.join(self.root, participant_id, f"{feature}-{digest}.pkl")
+
+    def load(self, participant_id: str, feature: str, params: dict):
+        path = self._path(participant_id, feature, params)
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def save(self, participant_id: str, feature: str, params: dict, entry: dict):
+        path = self._path(participant_id, feature, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def usable(entry, start: int) -> bool:
+        """Whether ``entry`` covers ``start`` with day bins aligned to it."""
+        return entry is not None and entry['start'] <= start and (start - entry['start']) % MS_IN_DAY == 0
+
+    def fetch_start(self, entry, start: int) -> int:
+        """Return the timestamp cortex must be queried from, given a cached ``entry``."""
+        if not self.usable(entry, start):
+            return start
+        cached_days = (entry['end'] - entry['start']) // MS_IN_DAY
+        resume_day = max(0, cached_days - self.overlap_days)
+        return max(start, entry['start'] + resume_day * MS_IN_DAY)
+
+    def fetch(self, participant_id: str, features, feature_params: dict, start: int, end: int, pull) -> dict:
+        """Return {feature: DataFrame} for ``start``..``end``, pulling only what is not cached.
+
+        ``pull(features, start, end)`` performs the actual cortex request and
+        returns {feature: DataFrame}. Features that resume from the same day
+        share one pull. A feature missing from a pull's result is left out of
+        the returned dict and its cache entry is not touched.
+        """
+        entries = {}
+        groups = {}
+        for feature in features:
+            params = feature_params.get(feature, {})
+            entry = self.load(participant_id, feature, params)
+            fetch_from = self.fetch_start(entry, start)
+            entries[feature] = entry if self.usable(entry, start) else None
+            groups.setdefault(fetch_from, []).append(feature)
+
+        result = {}
+        for fetch_from, group in sorted(groups.items()):
+            fresh = pull(group, fetch_from, end)
+            logger.info(f"Pulled {group} for {participant_id} from {fetch_from} "
+                        f"({(end - fetch_from) // MS_IN_DAY} days)")
+            for feature in group:
+                if feature not in fresh:
+                    continue
+                params = feature_params.get(feature, {})
+                entry = entries[feature]
+                frame = fresh[feature]
+                cache_start = fetch_from
+                if entry is not None:
+                    cache_start = entry['start']
+                    cached = entry['data']
+                    if not cached.empty:
+                        cached = cached[timestamps_ms(cached) < fetch_from]
+                        frame = pd.concat([cached, frame], ignore_index=True) if not frame.empty else cached
+                self.save(participant_id, feature, params, {'start': cache_start, 'end': end, 'data': frame})
+
+                if not frame.empty:
+                    frame = frame[timestamps_ms(frame) >= start].reset_index(drop=True)
+                result[feature] = frame
+        return result
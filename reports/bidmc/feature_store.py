@@ -0,0 +1,154 @@
+"""Columnar store for the merged per-participant daily feature table.
+
+Each report persists its final daily table (passive features joined with the
+survey scores) as Parquet, partitioned by participant and month:
+
+    <root>/participant=<id>/month=<YYYY-MM>/<part>.parquet
+
+Reads go through a memory-mapped pyarrow dataset, so later reports, analyst
+exports and cohort summaries can load only the columns and date range they
+need without rebuilding anything from cortex.
+
+Usage (export):
+    python feature_store.py --store_dir /data/daily --participant_id U0123456789 --columns steps,anxiety \
+        --start 2024-01-01 --end 2024-03-31 --output steps.csv
+"""
+
+import os
+import sys
+import argparse
+import logging
+from datetime import date
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "lamp-reports", "daily")
+
+PARTITION_COLUMNS = ['participant', 'month']
+
+
+class DailyFeatureStore:
+    """Parquet-backed store of daily feature tables, partitioned by participant/month."""
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        if not HAVE_PYARROW:
+            raise RuntimeError("pyarrow is required for the daily feature store")
+        self.root = root
+        self.filesystem = pafs.LocalFileSystem(use_mmap=True)
+        self.partitioning = ds.partitioning(
+            pa.schema([('participant', pa.string()), ('month', pa.string())]), flavor='hive'
+        )
+
+    def write(self, participant_id: str, daily_df: pd.DataFrame):
+        """Persist ``daily_df`` (one row per ``date``) into the months it touches.
+
+        A month is rewritten as a whole, so rows already stored for its other
+        days are read back and kept; for a day in both, the new row wins.
+        """
+        if daily_df.empty:
+            return
+        frame = daily_df.copy()
+        frame['date'] = pd.to_datetime(frame['date']).dt.date
+        first, last = min(frame['date']), max(frame['date'])
+        stored = self.read(participant_id, start=first.replace(day=1),
+                           end=(pd.Timestamp(last) + pd.offsets.MonthEnd(0)).date())
+        stored = stored[~stored['date'].isin(set(frame['date']))]
+        if not stored.empty:
+            frame = pd.concat([stored, frame], ignore_index=True).sort_values('date', ignore_index=True)
+        frame['participant'] = participant_id
+        frame['month'] = pd.to_datetime(frame['date']).dt.strftime('%Y-%m')
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        os.makedirs(self.root, exist_ok=True)
+        pq.write_to_dataset(
+            table,
+            self.root,
+            partitioning=self.partitioning,
+            existing_data_behavior='delete_matching',
+        )
+        logger.info(f"Stored {len(frame)} daily rows for {participant_id} in {self.root}")
+
+    def _dataset(self, path: str):
+        dataset = ds.dataset(path, format='parquet', filesystem=self.filesystem,
+                             partitioning=self.partitioning)
+        # Months written before a feature existed (e.g. no steps yet) lack that
+        # column; unify so every requested column is present, null-filled.
+        schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+        if not schemas:
+            return None
+        schema = pa.unify_schemas(schemas + [self.partitioning.schema])
+        return ds.dataset(path, schema=schema, format='parquet', filesystem=self.filesystem,
+                          partitioning=self.partitioning)
+
+    @staticmethod
+    def _filter(participant_ids=None, start: date = None, end: date = None):
+        expression = None
+
+        def both(left, right):
+            return right if left is None else left & right
+
+        if participant_ids is not None:
+            expression = both(expression, ds.field('participant').isin(list(participant_ids)))
+        if start is not None:
+            expression = both(expression, ds.field('month') >= start.strftime('%Y-%m'))
+            expression = both(expression, ds.field('date') >= pa.scalar(start, pa.date32()))
+        if end is not None:
+            expression = both(expression, ds.field('month') <= end.strftime('%Y-%m'))
+            expression = both(expression, ds.field('date') <= pa.scalar(end, pa.date32()))
+        return expression
+
+    def read_cohort(self, participant_ids=None, columns=None, start: date = None, end: date = None) -> pd.DataFrame:
+        """Load ``columns`` for ``participant_ids`` (all when None) between ``start`` and ``end``.
+
+        The result always carries ``participant`` and ``date`` columns.
+        """
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=['participant', 'date'] + list(columns or []))
+        dataset = self._dataset(self.root)
+        if dataset is None:
+            return pd.DataFrame(columns=['participant', 'date'] + list(columns or []))
+        if columns is not None:
+            columns = ['participant', 'date'] + [c for c in columns if c not in ('participant', 'date')]
+        table = dataset.to_table(columns=columns, filter=self._filter(participant_ids, start, end))
+        frame = table.to_pandas()
+        if 'month' in frame:
+            frame = frame.drop(columns=['month'])
+        return frame.sort_values(['participant', 'date']).reset_index(drop=True)
+
+    def read(self, participant_id: str, columns=None, start: date = None, end: date = None) -> pd.DataFrame:
+        """Load one participant's daily table, optionally restricted to ``columns`` and a date range."""
+        frame = self.read_cohort([participant_id], columns=columns, start=start, end=end)
+        return frame.drop(columns=['participant'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export daily features from the report feature store.")
+    parser.add_argument('--participant_id', action='append', help="Repeat for several participants; omit for all")
+    parser.add_argument('--columns', help="Comma-separated feature columns (default: all)")
+    parser.add_argument('--start', type=date.fromisoformat)
+    parser.add_argument('--end', type=date.fromisoformat)
+    parser.add_argument('--store_dir', default=os.getenv("REPORT_STORE_DIR"),
+                        help="Store written by reports run with --store_dir (env REPORT_STORE_DIR)")
+    parser.add_argument('--output', help="CSV path (default: stdout)")
+    args = parser.parse_args(argv)
+    if not args.store_dir:
+        parser.error("no feature store; pass --store_dir or set REPORT_STORE_DIR")
+
+    store = DailyFeatureStore(args.store_dir)
+    columns = args.columns.split(',') if args.columns else None
+    frame = store.read_cohort(args.participant_id, columns=columns, start=args.start, end=args.end)
+    frame.to_csv(args.output or sys.stdout, index=False)
+
+
+if __name__ == "__main__":
+    main()
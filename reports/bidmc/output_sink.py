@@ -0,0 +1,203 @@
+"""Streaming report output.
+
+``SectionWriter`` writes the report page in document order while the stage
+graph is still running: each section goes out as soon as it and every section
+before it are ready, so the finished document never has to sit in memory.
+
+Sinks take text or bytes and either ``commit()`` (the artifact appears at its
+final location) or ``abort()``. ``open_sink`` picks one for a path:
+
+- local paths get a ``LocalFileSink``; what was written before an abort stays
+  in ``<path>.partial`` for inspection,
+- ``s3://bucket/key`` URLs get an ``S3MultipartSink``, which uploads a part
+  every REPORT_UPLOAD_PART_MB (default 8) as the report is produced and only
+  makes the object visible on commit. HTML is gzipped on the way and stored
+  with ``Content-Encoding: gzip`` (REPORT_GZIP_HTML=0 turns that off).
+
+boto3 reads ``AWS_ENDPOINT_URL_S3``, so the S3 sink can be pointed at a local
+S3 stand-in (moto server, MinIO) for testing.
+"""
+
+import os
+import sys
+import zlib
+import mimetypes
+
+try:
+    import boto3
+    HAVE_BOTO3 = True
+except ImportError:
+    HAVE_BOTO3 = False
+
+# S3 requires every part but the last to be at least 5 MiB.
+UPLOAD_PART_SIZE = max(5, int(os.getenv("REPORT_UPLOAD_PART_MB", 8))) * 1024 * 1024
+GZIP_HTML = os.getenv("REPORT_GZIP_HTML", "1") == "1"
+
+
+class LocalFileSink:
+    """Writes to ``<path>.partial`` and renames it over ``path`` on commit."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.partial_path, 'wb')
+
+    def write(self, data):
+        self.file.write(data.encode('utf-8') if isinstance(data, str) else data)
+        self.file.flush()
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        """Leave the partial file in place for inspection."""
+        self.file.close()
+
+
+class S3MultipartSink:
+    """Streams to ``s3://bucket/key`` with a multipart upload, one part per ``part_size`` bytes.
+
+    A report smaller than one part is sent with a single ``put_object`` on commit.
+    """
+
+    def __init__(self, url: str, content_type: str = 'application/octet-stream', gzip: bool = False,
+                 part_size: int = UPLOAD_PART_SIZE, client=None):
+        if client is None:
+            if not HAVE_BOTO3:
+                raise RuntimeError("boto3 is required for s3:// outputs")
+            client = boto3.client('s3')
+        self.client = client
+        self.bucket, _, self.key = url[len('s3://'):].partition('/')
+        self.part_size = part_size
+        self.object_args = {'ContentType': content_type}
+        if gzip:
+            self.object_args['ContentEncoding'] = 'gzip'
+        # wbits=31 writes a gzip header and trailer
+        self.compressor = zlib.compressobj(wbits=31) if gzip else None
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_uploaded = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.object_args)['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=bytes(self.buffer))
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.bytes_uploaded += len(self.buffer)
+        self.buffer.clear()
+
+    def commit(self):
+        if self.compressor:
+            self.buffer += self.compressor.flush()
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), **self.object_args)
+            self.bytes_uploaded += len(self.buffer)
+            self.buffer.clear()
+            return
+        if self.buffer:
+            self._upload_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        """Drop the upload; S3 would otherwise keep (and bill for) the uploaded parts."""
+        self.buffer.clear()
+        if self.upload_id is None:
+            return
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            print(f"[WARN] Could not abort upload of s3://{self.bucket}/{self.key}: {e}", file=sys.stderr)
+
+
+def open_sink(path: str):
+    """Return the sink for a local path or an ``s3://`` URL."""
+    if path.startswith('s3://'):
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        gzip = GZIP_HTML and content_type == 'text/html'
+        if content_type.startswith('text/') or content_type == 'application/json':
+            content_type += '; charset=utf-8'
+        return S3MultipartSink(path, content_type=content_type, gzip=gzip)
+    return LocalFileSink(path)
+
+
+def write_artifact(path: str, data):
+    """Write ``data`` (text or bytes) to a local path or ``s3://`` URL in one go."""
+    sink = open_sink(path)
+    try:
+        sink.write(data)
+        sink.commit()
+    except BaseException:
+        sink.abort()
+        raise
+
+
+def upload_file(local_path: str, path: str, chunk_size: int = 1024 * 1024):
+    """Copy a local file to ``path`` through its sink without reading it whole."""
+    sink = open_sink(path)
+    try:
+        with open(local_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sink.write(chunk)
+        sink.commit()
+    except BaseException:
+        sink.abort()
+        raise
+
+
+class SectionWriter:
+    """Emits named sections to ``sink`` in the order given by ``sections``.
+
+    Sections may be handed over in any order; one that arrives early is held
+    only until the sections before it have been written.
+    """
+
+    def __init__(self, sink, sections, header: str = '', footer: str = ''):
+        self.sink = sink
+        self.order = list(sections)
+        self.footer = footer
+        self.pending = {}
+        self.next_index = 0
+        self.bytes_written = 0
+        if header:
+            self._emit(header)
+
+    def _emit(self, text: str):
+        self.sink.write(text)
+        self.bytes_written += len(text)
+
+    def write(self, name: str, html: str):
+        if name not in self.order:
+            raise KeyError(f"Unknown report section {name!r}")
+        self.pending[name] = html
+        while self.next_index < len(self.order) and self.order[self.next_index] in self.pending:
+            self._emit(self.pending.pop(self.order[self.next_index]))
+            self.next_index += 1
+
+    def close(self):
+        """Write the footer and commit the sink; every section must have been written."""
+        missing = self.order[self.next_index:]
+        if missing:
+            raise RuntimeError(f"Report sections never written: {', '.join(missing)}")
+        self._emit(self.footer)
+        self.sink.commit()
+
+    def abort(self):
+        self.sink.abort()
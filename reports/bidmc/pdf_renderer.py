@@ -0,0 +1,99 @@
+"""Static PDF output for the report generators.
+
+Interactive figures cannot be printed, so for PDF output the plotly figures are
+rasterised with kaleido and the altair chart with vl-convert. The page is then
+converted with wkhtmltopdf through pdfkit.
+
+Keep one ``PdfRenderer`` per process (``get_renderer()``). kaleido's headless
+Chromium is started on first use and stays up, and vl-convert keeps its engine
+loaded, so every report after the first pays only for the renders. Batch and
+worker children are forked per report, so each starts its own.
+"""
+
+import base64
+import shutil
+from importlib.util import find_spec
+
+import pdfkit
+import plotly.io as pio
+
+# plotly's static image engine; plotly imports it itself when rendering
+HAVE_KALEIDO = find_spec('kaleido') is not None
+
+try:
+    import vl_convert as vlc
+    HAVE_VL_CONVERT = True
+except ImportError:
+    HAVE_VL_CONVERT = False
+
+PDFKIT_OPTIONS = {
+    'encoding': 'UTF-8',
+    'page-size': 'Letter',
+    'quiet': '',
+}
+
+
+def png_to_html(png: bytes, width: str = '100%') -> str:
+    encoded = base64.b64encode(png).decode("utf-8")
+    return f'<img style="max-width:{width}" src="data:image/png;base64,{encoded}">'
+
+
+class PdfRenderer:
+    """Renders figures to static images and finished report HTML to PDF."""
+
+    def __init__(self, wkhtmltopdf: str = None):
+        binary = wkhtmltopdf or shutil.which('wkhtmltopdf')
+        if not binary:
+            raise RuntimeError("wkhtmltopdf is required for PDF output but was not found on PATH")
+        # Without the exporters every chart would be a placeholder; refuse rather than ship that.
+        missing = [name for name, present in (('kaleido', HAVE_KALEIDO), ('vl-convert-python', HAVE_VL_CONVERT))
+                   if not present]
+        if missing:
+            raise RuntimeError(f"{' and '.join(missing)} must be installed for charts in PDF output")
+        self.pdfkit_config = pdfkit.configuration(wkhtmltopdf=binary)
+        self._warm = False
+
+    def warm(self):
+        """Start kaleido's Chromium now rather than on the first report's first figure."""
+        if self._warm:
+            return
+        import plotly.graph_objects as go
+        pio.to_image(go.Figure(), format='png', width=10, height=10)
+        self._warm = True
+
+    def plotly_html(self, fig, width: int = 1000, height: int = 500) -> str:
+        png = pio.to_image(fig, format='png', width=width, height=height, engine='kaleido')
+        self._warm = True
+        return png_to_html(png)
+
+    def altair_html(self, chart) -> str:
+        return png_to_html(vlc.vegalite_to_png(chart.to_json(), scale=2), width='60%')
+
+    def write_pdf(self, html: str, output) -> None:
+        """Convert ``html`` to PDF and write it to ``output`` (a path or binary file object)."""
+        pdf = pdfkit.from_string(html, False, configuration=self.pdfkit_config, options=PDFKIT_OPTIONS)
+        self._write(pdf, output)
+
+    def write_pdf_file(self, html_path: str, output) -> None:
+        """Like ``write_pdf`` for a page already written to ``html_path``."""
+        pdf = pdfkit.from_file(html_path, False, configuration=self.pdfkit_config, options=PDFKIT_OPTIONS)
+        self._write(pdf, output)
+
+    @staticmethod
+    def _write(pdf: bytes, output) -> None:
+        if isinstance(output, (str, bytes)):
+            with open(output, 'wb') as f:
+                f.write(pdf)
+        else:
+            output.write(pdf)
+
+
+_renderer = None
+
+
+def get_renderer() -> PdfRenderer:
+    """Return this process's shared renderer, creating it on first use."""
+    global _renderer
+    if _renderer is None:
+        _renderer = PdfRenderer()
+    return _renderer
@@ -0,0 +1,167 @@
+"""Small stage-graph runner used by the report generators.
+
+A report is described as a list of named ``Stage`` objects, each declaring the
+context keys it reads and the keys it produces. ``run_stages`` executes every
+stage as soon as its inputs exist, so independent upstream pulls overlap
+instead of running back to back.
+"""
+
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """A named unit of work with declared inputs and outputs.
+
+    ``func`` is called with the declared inputs as keyword arguments and must
+    return one value per declared output (a tuple when there is more than one).
+    Stages marked ``concurrent`` run on the worker pool; everything else runs
+    on the calling thread, which keeps matplotlib (not thread-safe) off the pool.
+    Stages marked ``checkpoint`` have their outputs saved when a checkpoint is
+    passed to ``run_stages``; mark the expensive ones with picklable outputs.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), concurrent=False, progress=None, checkpoint=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.concurrent = concurrent
+        self.progress = progress  # optional (percent, message) reported on completion
+        self.checkpoint = checkpoint
+
+    def ready(self, context: dict) -> bool:
+        return all(key in context for key in self.inputs)
+
+    def run(self, **inputs) -> dict:
+        result = self.func(**inputs)
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        if len(self.outputs) == 0:
+            return {}
+        return dict(zip(self.outputs, result))
+
+    def __repr__(self):
+        return f"<Stage {self.name}: {', '.join(self.inputs)} -> {', '.join(self.outputs)}>"
+
+
+def plan_resume(stages, completed):
+    """Split ``stages`` into (to_run, to_restore) given the names of checkpointed stages.
+
+    Walks back from the final stages (those whose outputs nothing reads, or
+    that have no outputs). A completed checkpoint satisfies its stage, and
+    upstream stages that only fed restored stages are not needed at all.
+    """
+    consumed = {key for stage in stages for key in stage.inputs}
+    producers = {key: stage for stage in stages for key in stage.outputs}
+    restorable = {stage.name for stage in stages if stage.checkpoint and stage.name in completed}
+
+    needed = set()
+    frontier = [stage for stage in stages if not stage.outputs or any(key not in consumed for key in stage.outputs)]
+    while frontier:
+        stage = frontier.pop()
+        if stage.name in needed:
+            continue
+        needed.add(stage.name)
+        if stage.name in restorable:
+            continue
+        frontier.extend(producers[key] for key in stage.inputs if key in producers)
+
+    to_run = [stage for stage in stages if stage.name in needed and stage.name not in restorable]
+    to_restore = [stage for stage in stages if stage.name in needed and stage.name in restorable]
+    return to_run, to_restore
+
+
+def run_stages(stages, context: dict, max_workers: int = 4, on_stage_complete=None, timer=None,
+               release: bool = False, checkpoint=None) -> dict:
+    """Run ``stages`` against ``context`` and return the populated context.
+
+    ``on_stage_complete(stage)`` is called on the calling thread after each
+    stage's outputs have been merged into the context. When a ``timer``
+    (``stage_timing.StageTimer``) is given, every stage runs inside
+    ``timer.measure(stage.name)``.
+
+    With ``release`` set, a stage output is dropped from the context as soon as
+    the last stage that reads it has finished, so large intermediates (raw
+    sensor frames, rendered images) do not live for the whole run. Outputs no
+    stage reads, and keys that were in the context to begin with, are kept.
+
+    Concurrent stages are finished on the calling thread as soon as they
+    complete, between inline stages. With a ``checkpoint``
+    (``checkpoint.StageCheckpoint``), outputs of checkpointed stages are saved
+    as they finish, and stages completed by an earlier attempt are restored
+    instead of run (see ``plan_resume``).
+    """
+    produced = {key for stage in stages for key in stage.outputs}
+    restored = []
+    if checkpoint is not None:
+        stages, restored = plan_resume(stages, checkpoint.completed)
+    pending = list(stages)
+    running = {}
+    readers = {}  # key -> number of stages still to read it
+    for stage in stages:
+        for key in stage.inputs:
+            readers[key] = readers.get(key, 0) + 1
+
+    def release_inputs(stage):
+        for key in stage.inputs:
+            readers[key] -= 1
+            if release and readers[key] == 0 and key in produced:
+                context.pop(key, None)
+                logger.debug(f"Released {key} after {stage.name}")
+
+    def execute(stage, inputs):
+        with timer.measure(stage.name) if timer else nullcontext():
+            return stage.run(**inputs)
+
+    def finish(stage, outputs):
+        context.update(outputs)
+        release_inputs(stage)
+        logger.debug(f"Stage {stage.name} complete")
+        if checkpoint is not None and stage.checkpoint:
+            checkpoint.save(stage.name, outputs)
+        if on_stage_complete:
+            on_stage_complete(stage)
+
+    for stage in restored:
+        context.update(checkpoint.load(stage.name))
+        logger.debug(f"Stage {stage.name} restored from checkpoint")
+        if on_stage_complete:
+            on_stage_complete(stage)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Pool stages that completed while an inline stage ran are finished (and
+            # checkpointed) now, not when the inline stages run out.
+            for future in [future for future in running if future.done()]:
+                finish(running.pop(future), future.result())
+
+            ready = [stage for stage in pending if stage.ready(context)]
+
+            for stage in ready:
+                if stage.concurrent:
+                    pending.remove(stage)
+                    inputs = {key: context[key] for key in stage.inputs}
+                    running[pool.submit(execute, stage, inputs)] = stage
+
+            inline = next((stage for stage in ready if not stage.concurrent), None)
+            if inline is not None:
+                pending.remove(inline)
+                finish(inline, execute(inline, {key: context[key] for key in inline.inputs}))
+                continue
+
+            if not running:
+                missing = sorted({key for stage in pending for key in stage.inputs if key not in context})
+                raise RuntimeError(
+                    f"Stages {[stage.name for stage in pending]} are waiting on inputs nothing produces: {missing}"
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                finish(stage, future.result())
+
+    return context
@@ -0,0 +1,152 @@
+"""Report progress, written where the web app can read it.
+
+``app.py`` hands the generator ``--progress_file s3://<bucket>/progress/...`` and
+polls that object, so progress has to land in S3; local paths are still used
+by the batch generator and the worker. A ``ProgressReporter`` records each
+update with a timestamp and an ETA and hands it to a sink:
+
+- ``LocalProgressSink`` replaces the file atomically (no fsync; readers never
+  see a half-written file),
+- ``S3ProgressSink`` puts the JSON object,
+- ``MemoryProgressSink`` keeps every record, for embedding and benchmarks.
+
+Writes are throttled: an update is written at once when its message (the
+stage) changes or the run finishes or fails, otherwise at most once every
+REPORT_PROGRESS_INTERVAL seconds. A held-back update goes out with the next
+write or on ``flush()``.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from datetime import datetime, timezone
+
+try:
+    import boto3
+    HAVE_BOTO3 = True
+except ImportError:
+    HAVE_BOTO3 = False
+
+PROGRESS_INTERVAL = float(os.getenv("REPORT_PROGRESS_INTERVAL", 2))
+
+
+class LocalProgressSink:
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, record: dict):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
+
+
+class S3ProgressSink:
+    def __init__(self, url: str):
+        if not HAVE_BOTO3:
+            raise RuntimeError("boto3 is required for s3:// progress files")
+        self.bucket, _, self.key = url[len('s3://'):].partition('/')
+        self.client = boto3.client('s3')
+
+    def write(self, record: dict):
+        self.client.put_object(Bucket=self.bucket, Key=self.key, Body=json.dumps(record).encode('utf-8'),
+                               ContentType='application/json', CacheControl='no-cache')
+
+
+class MemoryProgressSink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record: dict):
+        self.records.append(record)
+
+    @property
+    def latest(self):
+        return self.records[-1] if self.records else None
+
+
+def progress_sink(target):
+    """Pick a sink for ``target``: None, a local path, an ``s3://`` URL or a sink object."""
+    if target is None or hasattr(target, 'write'):
+        return target
+    if target.startswith('s3://'):
+        return S3ProgressSink(target)
+    return LocalProgressSink(target)
+
+
+class ProgressReporter:
+    """Throttled progress updates for one run; a reporter without a sink ignores them."""
+
+    def __init__(self, sink=None, min_interval: float = PROGRESS_INTERVAL, clock=time.monotonic):
+        self.sink = sink
+        self.min_interval = min_interval
+        self.clock = clock
+        self.started = None
+        self.start_value = None
+        self.last_write = None
+        self.last_message = None
+        self.pending = None
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def _eta(self, value, elapsed: float):
+        """Seconds left, extrapolated from the progress made since the first update."""
+        if value >= 100:
+            return 0
+        if value < 0 or value <= self.start_value or elapsed <= 0:
+            return None
+        rate = (value - self.start_value) / elapsed
+        return round((100 - value) / rate)
+
+    def update(self, value, message=None, **extra):
+        if self.sink is None:
+            return
+        with self._lock:
+            now = self.clock()
+            if self.started is None:
+                self.started, self.start_value = now, value
+            elapsed = now - self.started
+            record = {
+                'progress': value,
+                'message': message,
+                'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'elapsed_s': round(elapsed, 1),
+                'eta_s': self._eta(value, elapsed),
+                **extra,
+            }
+            due = self.last_write is None or now - self.last_write >= self.min_interval
+            if due or message != self.last_message or value >= 100 or value < 0:
+                self._write(record, now)
+            else:
+                self.pending = record
+
+    def flush(self):
+        with self._lock:
+            if self.pending is not None:
+                self._write(self.pending, self.clock())
+
+    def _write(self, record: dict, now: float):
+        self.pending = None
+        self.last_write = now
+        self.last_message = record['message']
+        try:
+            self.sink.write(record)
+            self.writes += 1
+        except Exception as e:
+            print(f"[ERROR] Failed to write progress: {e}", file=sys.stderr)
+
+
+def open_progress(target, min_interval: float = PROGRESS_INTERVAL) -> ProgressReporter:
+    """Return a reporter for ``target`` (path, ``s3://`` URL, sink, reporter or None)."""
+    if isinstance(target, ProgressReporter):
+        return target
+    try:
+        return ProgressReporter(progress_sink(target), min_interval=min_interval)
+    except Exception as e:
+        print(f"[ERROR] Progress will not be reported to {target}: {e}", file=sys.stderr)
+        return ProgressReporter(None)
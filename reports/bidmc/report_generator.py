@@ -4,6 +4,7 @@ import os
 import sys
 import datetime
 import time
+IMPORTS_STARTED = (time.perf_counter(), time.process_time())
 import pytz
 import calplot
 import pandas as pd
@@ -14,26 +15,7 @@ from scipy.stats import ttest_ind, pearsonr
 
 from dotenv import load_dotenv
 
-load_dotenv()
-
-access_key = os.getenv("LAMP_ACCESS_KEY")
-secret_key = os.getenv("LAMP_SECRET_KEY")
-server_address = os.getenv("LAMP_SERVER_ADDRESS")
-
-missing_vars = []
-if not access_key:
-    missing_vars.append("LAMP_ACCESS_KEY")
-if not secret_key:
-    missing_vars.append("LAMP_SECRET_KEY")
-if not server_address:
-    missing_vars.append("LAMP_SERVER_ADDRESS")
-
-if missing_vars:
-    raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
-
 import LAMP
-LAMP.connect()
-
 import cortex
 import numpy as np
 import altair as alt
@@ -64,82 +46,41 @@ import plotly.io as pio
 import plotly.tools as tls
 import io
 import base64
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import json
 
 import argparse
-import json
-import sys
-import base64
-from datetime import datetime
-
-# ---------- Argument Parsing ----------
-parser = argparse.ArgumentParser(description="Generate LAMP report.")
-parser.add_argument('--participant_id', required=True)
-parser.add_argument('--start_date', required=True)
-parser.add_argument('--output_format', choices=['html', 'pdf'], required=True)
-parser.add_argument('--output_path', required=True)
-parser.add_argument('--progress_file', required=False, help="Path to write progress updates")
-args = parser.parse_args()
-
-# ---------- Progress Tracking ----------
-def update_progress(progress_file, value, message=None):
-    if progress_file:
-        try:
-            with open(progress_file, 'w') as f:
-                json.dump({"progress": value, "message": message}, f)
-                f.flush()
-                os.fsync(f.fileno())
-        except Exception as e:
-            print(f"[ERROR] Failed to write progress: {e}", file=sys.stderr)
-
-# Set progress file if provided
-progress_file = args.progress_file
-print(f"[INFO] Progress file: {progress_file}")
-
-update_progress(progress_file, 10, "Packages generated")
-
-# Assign variables
-participant_id = args.participant_id
-start_date = args.start_date
-output_format = args.output_format
-output_path = args.output_path
-
-
-part = participant_id
-start = start_date
 
+from pipeline import Stage, run_stages
+from feature_cache import FeatureCache
+from feature_store import DailyFeatureStore, HAVE_PYARROW
+import calendar_render
+from calendar_render import fig_to_html
+from pdf_renderer import get_renderer
+from progress_sink import open_progress
+from output_sink import SectionWriter, LocalFileSink, open_sink, upload_file
+from stage_timing import StageTimer, peak_rss_mb
+from checkpoint import StageCheckpoint
+from sharded_pull import PullStats, pull_sharded, merge_frames, merge_lists
 
-run_sleep=False
-# default end date is now
-end_date = cortex.now()
-
-
-def timestamp(dt):
-    local = pytz.timezone("America/New_York")
-    date = datetime.strptime(dt, '%Y-%m-%d')
-    local_dt = local.localize(date, is_dst=None)
-    utc_dt = local_dt.astimezone(pytz.utc)
-    utc_dt.replace(tzinfo=timezone.utc).timestamp() * 1000
-    return int(utc_dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
-
-start_date = timestamp(start)
+IMPORT_TIMES = (time.perf_counter() - IMPORTS_STARTED[0], time.process_time() - IMPORTS_STARTED[1])
 
 MS_IN_DAY = 86400000
-# This document presents the data that was collected during your time during the social media study. You can keep this document for your records or use it as a reference when working with a new clinician or health provider. Feel free to reach out to the study team (jburns9@bidmc.harvard.edu) with any questions.
 
-# This graph shows the activities that you completed each day. Dates are along the x-axis, while the y-axis shows how many activities you completed that day, and the colors on the bars designate the activity names.
+PASSIVE_FEATURES = ['screen_duration', 'nearby_device_count', 'entropy', 'data_quality', 'hometime', 'steps']
+PASSIVE_FEATURE_PARAMS = {'screen_duration': {}, 'entropy': {},
+                          'data_quality': {"feature": "gps", "bin_size": 3600000}}
 
+# Memory-efficient mode (--low_memory): reduce raw step samples to daily rows right after the pull
+LOW_MEMORY = os.getenv("REPORT_LOW_MEMORY", "") == "1"
 
-# ### Quick notes about interpreting correlations:
-# 
-# - The numbers and colors correspond to the strength of the relationship. A correlation of -1 indicates a perfect negative relationship (as one variable increases the other variable decreases), and a correlation of 1 indicates a perfect positive relationship (both variables are increasing or decreasing).
-# - A correlation of 0 means there is no linear relationship. However, just because a correlation is 0 does not necessarily mean there is no relationship there. There is always the possibility two variables have a nonlinear relationship.
-# - Correlation does not equal causation. This graph cannot show that one variable causes a change in another variable, only how changes in variables are associated with each other.
-# 
-# Potential example of interpreting this graph: Maybe you have a negative correlation between mood and steps. A negative correlation indicates that on days when your steps are higher, your mood is higher/better. Questions to think about: How does going on a walk make you feel? Do you usually feel better, worse, or about the same after you go on walks?
+# passive_df columns, in report order
+DAILY_COLUMNS = ['screen_duration', 'entropy', 'data_quality', 'hometime', 'steps']
 
-update_progress(progress_file, 30, "Survey Scoring")
+CALENDAR_METRICS = ['entropy', 'hometime', 'data_quality', 'screen_duration',
+                    'steps', 'anxiety', 'depression', 'dysfunction']
 
 score_dict = {'category_list': ['Daily Mood Survey', 'Daily Anxiety Survey', 'Daily Function Survey', 'Daily SM Survey'],
                     'questions': {
@@ -153,9 +94,9 @@ score_dict = {'category_list': ['Daily Mood Survey', 'Daily Anxiety Survey', 'Da
                         '9': 9,
                         '8': 8,
                         '7': 7,
-                        '6': 6, 
-                        '5': 5, 
-                        '4': 4, 
+                        '6': 6,
+                        '5': 5,
+                        '4': 4,
                         '3': 3,
                         '2': 2,
                         '1': 1,
@@ -166,9 +107,9 @@ score_dict = {'category_list': ['Daily Mood Survey', 'Daily Anxiety Survey', 'Da
                         '9': 1,
                         '8': 2,
                         '7': 3,
-                        '6': 4, 
-                        '5': 5, 
-                        '4': 6, 
+                        '6': 4,
+                        '5': 5,
+                        '4': 6,
                         '3': 7,
                         '2': 8,
                         '1': 9,
@@ -181,254 +122,344 @@ score_dict = {'category_list': ['Daily Mood Survey', 'Daily Anxiety Survey', 'Da
                         '1': 3,
                         '0': 4}
                     }
-update_progress(progress_file, 30, "Survey Scoring")
-
-update_progress(progress_file, 40, "Pulling passive data...")
-#Pulling passive data
-try:
-    passive = cortex.run(part,
-                            ['screen_duration','nearby_device_count', 'entropy', 'data_quality', 'hometime', 'steps'],
-                            feature_params={'screen_duration': {}, 'entropy': {},
-                            'data_quality': {"feature":"gps", "bin_size":3600000}},
-                            start=start_date,
-                            end=end_date)
-except Exception as e:
-    passive = cortex.run(part,
-                            ['screen_duration', 'nearby_device_count','entropy', 'data_quality', 'hometime'],
-                            feature_params={'screen_duration': {}, 'entropy': {},
-                            'data_quality': {"feature":"gps", "bin_size":3600000}},
-                            start=start_date,
-                            end=end_date)
-
-update_progress(progress_file, 70, "Passive Data Pull Complete!")
-
-
-passive_df = pd.DataFrame()
-for key in passive:
-    if key != 'steps':
-        passive_df[key] = passive[key]['value']
-        passive_df['date'] = passive[key]['timestamp']
-    else:
-        if passive[key].empty:
-            continue
-        else:
-            step_df = passive[key]
-            step_df = step_df[step_df['type'] == 'step_count']
-            step_df['timestamp'] = pd.to_datetime(step_df['timestamp'], errors='coerce')  # Convert to datetime
-            step_df['date'] = step_df['timestamp'].dt.date
-            step_df = step_df.groupby('date')['value'].max().reset_index()
-            passive_df['steps'] = step_df['value']
-
-if 'steps' in passive_df:
-    passive_df = passive_df[['date', 'screen_duration', 'entropy', 'data_quality', 'hometime', 'steps']]
-else:
-    passive_df = passive_df[['date', 'screen_duration', 'entropy', 'data_quality', 'hometime']]
-
-
-
-
-
-daily_dict_responses = cortex.primary.survey_scores.survey_scores(id=part,
-                                                        start=start_date,
-                                                        end=end_date,
-                                                        return_ind_ques=1,
-                                                        scoring_dict=score_dict)
-response_data = daily_dict_responses['data']
-function = []
-anxiety = []
-mood = []
-sm = []
-est = pytz.timezone('US/Eastern')
-
-for item in response_data:
-    if item['question'] == "Daily Function Survey":
-        function.append({'score':item['score'], 'date':item['end']})
-    if item['question'] == "Daily Anxiety Survey":
-        anxiety.append({'score':item['score'], 'date':item['end']})
-    if item['question'] == "Daily Mood Survey":
-        mood.append({'score':item['score'], 'date':item['end']})
-    if item['question'] == "Daily SM Survey":
-        sm.append({'score':item['score'], 'date':item['end']})
-
-
-for dictionary in function:
-    dictionary['date'] = datetime.fromtimestamp(dictionary['date']/1000, tz=timezone.utc)
-    dictionary['date'] = dictionary['date'].astimezone(est).date()
-
-
-for dictionary in anxiety:
-    dictionary['date'] = datetime.fromtimestamp(dictionary['date']/1000, tz=timezone.utc)
-    dictionary['date'] = dictionary['date'].astimezone(est).date()
-
-for dictionary in mood:
-    dictionary['date'] = datetime.fromtimestamp(dictionary['date']/1000, tz=timezone.utc)
-    dictionary['date'] = dictionary['date'].astimezone(est).date()
-
-for dictionary in sm:
-    dictionary['date'] = datetime.fromtimestamp(dictionary['date']/1000, tz=timezone.utc)
-    dictionary['date'] = dictionary['date'].astimezone(est).date()
-
-
-daily_df_function = pd.DataFrame(function)
-daily_df_anxiety = pd.DataFrame(anxiety)
-daily_df_mood = pd.DataFrame(mood)
-daily_df_sm = pd.DataFrame(sm)
 
 
+# ---------- LAMP Connection ----------
+def connect():
+    load_dotenv()
 
+    access_key = os.getenv("LAMP_ACCESS_KEY")
+    secret_key = os.getenv("LAMP_SECRET_KEY")
+    server_address = os.getenv("LAMP_SERVER_ADDRESS")
 
-passive_df['date'] = pd.to_datetime(passive_df['date'], unit='ms')
+    missing_vars = []
+    if not access_key:
+        missing_vars.append("LAMP_ACCESS_KEY")
+    if not secret_key:
+        missing_vars.append("LAMP_SECRET_KEY")
+    if not server_address:
+        missing_vars.append("LAMP_SERVER_ADDRESS")
 
-passive_df['date'] = passive_df['date'].dt.tz_localize('UTC')
+    if missing_vars:
+        raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
 
-passive_df['date'] = passive_df['date'].dt.tz_convert('US/Eastern')
+    LAMP.connect()
 
-passive_df['date'] = passive_df['date'].apply(lambda x: x.date())
 
-if len(daily_df_function) > 0:
-    daily_df_function = daily_df_function.groupby('date')['score'].mean().reset_index()
-    daily_df_function = daily_df_function.rename(columns=({'score':'difficulty functioning'}))
-    passive_df = passive_df.merge(daily_df_function, on=['date'], how='left')
-
-if len(daily_df_anxiety) > 0:
-    daily_df_anxiety = daily_df_anxiety.groupby('date')['score'].mean().reset_index()
-    daily_df_anxiety = daily_df_anxiety.rename(columns=({'score':'anxiety'}))
-    passive_df = passive_df.merge(daily_df_anxiety, on=['date'], how='left')
-
-if len(daily_df_mood) > 0:
-    daily_df_mood = daily_df_mood.groupby('date')['score'].mean().reset_index()
-    daily_df_mood = daily_df_mood.rename(columns=({'score':'depression'}))
-    passive_df = passive_df.merge(daily_df_mood, on=['date'], how='left')
-
-if len(daily_df_sm) > 0:
-    daily_df_sm = daily_df_sm.groupby('date')['score'].mean().reset_index()
-    daily_df_sm = daily_df_sm.rename(columns=({'score':'Social Media Use'}))
-    passive_df = passive_df.merge(daily_df_sm, on=['date'], how='left')
+def timestamp(dt):
+    local = pytz.timezone("America/New_York")
+    date = datetime.strptime(dt, '%Y-%m-%d')
+    local_dt = local.localize(date, is_dst=None)
+    utc_dt = local_dt.astimezone(pytz.utc)
+    return int(utc_dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
 
 
-passive_df['screen_duration'] = passive_df['screen_duration'].replace(0, np.nan)
-passive_df['entropy'] = passive_df['entropy'].replace(0, np.nan)
+# This document presents the data that was collected during your time during the social media study. You can keep this document for your records or use it as a reference when working with a new clinician or health provider. Feel free to reach out to the study team (jburns9@bidmc.harvard.edu) with any questions.
 
+# This graph shows the activities that you completed each day. Dates are along the x-axis, while the y-axis shows how many activities you completed that day, and the colors on the bars designate the activity names.
 
-try:
-    sleep_df['date'] = sleep_df['timestamp'].apply(lambda x: x.strftime('%Y-%m-%d'))
-    sleep_df = sleep_df[['date', 'hours']]
-    sleep_df.columns = ['date', 'sleep duration']
-    passive_df = pd.merge(passive_df, sleep_df, on=['date'])
-    passive_df['sleep duration'] = passive_df['sleep duration'].astype(float)
 
-except:
-    pass
+# ---------- Data Pull Stages ----------
+# None of these depend on each other, so they run concurrently on the stage pool.
+
+def cortex_run(participant_id, features, start_ts, end_ts, stats=None, low_memory=False, timer=None):
+    def pull(start, end):
+        result = cortex.run(participant_id,
+                            features,
+                            feature_params=PASSIVE_FEATURE_PARAMS,
+                            start=start,
+                            end=end)
+        if low_memory and 'steps' in result:
+            # Each shard's raw samples are reduced before the next shard lands, not after the merge
+            result['steps'] = compact_steps(result['steps'])
+        return result
+
+    passive = pull_sharded(pull, start_ts, end_ts, merge_frames, label=f"cortex.run({', '.join(features)})",
+                           stats=stats, timer=timer)
+    if low_memory and 'steps' in passive:
+        passive['steps'] = compact_steps(passive['steps'])  # a day can span two shards
+    return passive
+
+
+def run_passive(participant_id, features, start_ts, end_ts, stats=None, low_memory=False, timer=None):
+    """Pull each feature with its own request and retries.
+
+    A feature that still fails is left out of the result (and recorded in
+    ``stats``); only its sections drop out of the report.
+    """
+    with ThreadPoolExecutor(max_workers=len(features)) as pool:
+        futures = {feature: pool.submit(cortex_run, participant_id, [feature], start_ts, end_ts, stats, low_memory,
+                                        timer)
+                   for feature in features}
+    passive = {}
+    for feature, future in futures.items():
+        try:
+            passive.update(future.result())
+        except Exception as e:
+            print(f"[WARN] Could not pull {feature}; leaving it out of the report: {e}", file=sys.stderr)
+            if stats:
+                stats.feature_failed(feature, e)
+    return passive
+
+
+def compact_steps(steps):
+    """One row per day holding that day's maximum step_count, from raw or already daily steps.
+
+    Raw step samples are by far the largest thing a report holds, and
+    build_passive_df only ever keeps each day's maximum step_count, which it
+    computes the same way from these daily rows.
+    """
+    if steps.empty:
+        return steps
+    timestamps = steps['timestamp'].to_numpy()
+    values = steps['value'].to_numpy()
+    if 'type' in steps:
+        counts = steps['type'].to_numpy() == 'step_count'
+        timestamps, values = timestamps[counts], values[counts]
+    days = pd.to_datetime(timestamps, errors='coerce').normalize()
+    return (pd.Series(values, index=days).groupby(level=0).max()
+            .rename_axis('timestamp').reset_index(name='value'))
+
+
+def compact_passive(passive):
+    """Reduce the steps in ``passive`` to daily rows (for frames that come whole from the cache)."""
+    if passive.get('steps') is not None:
+        passive['steps'] = compact_steps(passive.pop('steps'))
+    return passive
+
+
+def pull_passive(participant_id, start_ts, end_ts, feature_cache=None, low_memory=False, pull_stats=None,
+                 timer=None):
+    if feature_cache is None:
+        return run_passive(participant_id, PASSIVE_FEATURES, start_ts, end_ts, pull_stats, low_memory, timer)
+
+    # A failed feature is missing from the pull, so its cache entry is left as it was.
+    def pull(features, start, end):
+        return run_passive(participant_id, features, start, end, pull_stats, timer=timer)
+
+    # The cache keeps raw frames; compaction applies to this run's copy only.
+    passive = feature_cache.fetch(participant_id, PASSIVE_FEATURES, PASSIVE_FEATURE_PARAMS,
+                                  start_ts, end_ts, pull)
+    return compact_passive(passive) if low_memory else passive
+
+
+def pull_survey_scores(participant_id, start_ts, end_ts, pull_stats=None, timer=None):
+    def pull(start, end):
+        daily_dict_responses = cortex.primary.survey_scores.survey_scores(id=participant_id,
+                                                                start=start,
+                                                                end=end,
+                                                                return_ind_ques=1,
+                                                                scoring_dict=score_dict)
+        return daily_dict_responses['data']
+
+    return pull_sharded(pull, start_ts, end_ts, merge_lists, label='survey_scores', stats=pull_stats, timer=timer)
+
+
+def pull_week_data_quality(participant_id, end_ts, pull_stats=None, timer=None):
+    # Accelerometer quality at 10 s bins: a different computation from the main
+    # pull's hourly gps data_quality, so it cannot be sliced out of ``passive``.
+    def pull(start, end):
+        return cortex.secondary.data_quality.data_quality(id=participant_id, start=start,
+                                                          end=end, resolution=86400000,
+                                                          feature='accelerometer', bin_size=10000)['data']
+
+    data_qual = pull_sharded(pull, end_ts - 7 * MS_IN_DAY, end_ts, merge_lists, label='data_quality(accelerometer)',
+                             stats=pull_stats, timer=timer)
+    #dq of the last week~!
+    return data_qual[-7:]
+
+
+# ---------- Shared Features ----------
+# Figures read features from the main passive pull instead of asking cortex again.
+
+def nearby_devices_from_passive(passive):
+    """Daily nearby-device counts keyed by date, from the main pull's nearby_device_count."""
+    frame = passive.get('nearby_device_count')
+    if frame is None or frame.empty:
+        return None
+    devices = pd.DataFrame({'timestamp': pd.to_datetime(frame['timestamp']).dt.date,
+                            'value': frame['value'].to_numpy()})
+    return devices.drop_duplicates('timestamp', keep='last').reset_index(drop=True)
+
+
+# ---------- DataFrame Assembly ----------
+
+# survey category -> daily score column, in the order the columns are merged
+SURVEY_COLUMNS = {
+    'Daily Function Survey': 'difficulty functioning',
+    'Daily Anxiety Survey': 'anxiety',
+    'Daily Mood Survey': 'depression',
+    'Daily SM Survey': 'Social Media Use',
+}
+
+
+def local_days(utc_times):
+    """Map tz-aware UTC datetimes to naive midnights of their US/Eastern calendar day."""
+    return utc_times.dt.tz_convert('US/Eastern').dt.normalize().dt.tz_localize(None)
+
+
+def daily_survey_scores(survey_responses):
+    """Average the scored responses per US/Eastern day, one column per survey category."""
+    responses = pd.DataFrame(survey_responses, columns=['question', 'score', 'end'])
+    responses = responses[responses['question'].isin(SURVEY_COLUMNS)]
+    if responses.empty:
+        return pd.DataFrame()
+    responses['question'] = responses['question'].astype('category')
+    responses['date'] = local_days(pd.to_datetime(responses['end'], unit='ms', utc=True))
+    daily_scores = responses.groupby(['date', 'question'], observed=True)['score'].mean().unstack('question')
+    daily_scores = daily_scores[[c for c in SURVEY_COLUMNS if c in daily_scores.columns]]
+    return daily_scores.rename(columns=SURVEY_COLUMNS).rename_axis(columns=None).reset_index()
+
+
+def build_passive_df(passive, survey_responses, low_memory=False):
+    passive_df = pd.DataFrame()
+    for key in passive:
+        if key != 'steps':
+            passive_df[key] = passive[key]['value']
+            passive_df['date'] = passive[key]['timestamp']
+        else:
+            if passive[key].empty:
+                continue
+            else:
+                step_df = passive[key]
+                if 'type' in step_df:  # compacted frames are step_count only
+                    step_df = step_df[step_df['type'] == 'step_count']
+                # Group on datetime64 midnights rather than one Python date object per sample
+                days = pd.to_datetime(step_df['timestamp'], errors='coerce').dt.normalize()
+                step_df = step_df['value'].groupby(days.rename('date')).max().astype('float64').reset_index()
+                passive_df['steps'] = step_df['value']
+
+    if 'date' not in passive_df:
+        raise RuntimeError("No daily passive features could be pulled for this participant")
+    # Features that failed to pull are simply absent
+    passive_df = passive_df[['date'] + [column for column in DAILY_COLUMNS if column in passive_df]]
+
+    # Passive rows and survey responses are both keyed by their US/Eastern calendar day.
+    passive_df['date'] = local_days(pd.to_datetime(passive_df['date'], unit='ms').dt.tz_localize('UTC'))
+
+    daily_scores = daily_survey_scores(survey_responses)
+    if not daily_scores.empty:
+        passive_df = passive_df.merge(daily_scores, on=['date'], how='left')
+
+    for column in ('screen_duration', 'entropy'):
+        if column in passive_df:
+            passive_df[column] = passive_df[column].replace(0, np.nan)
+
+    # Low-memory runs keep datetime64 midnights; build_plot_df converts them for
+    # the charts. Metric columns stay float64 either way: there is one row per
+    # day, and float32 would change the values written into the charts.
+    if not low_memory:
+        passive_df['date'] = passive_df['date'].dt.date.astype(object)
+    return passive_df
+
+
+def store_daily_features(participant_id, passive_df, feature_store=None):
+    if feature_store is None:
+        return
+    try:
+        feature_store.write(participant_id, passive_df)
+    except Exception as e:
+        print(f"[WARN] Failed to store daily features: {e}", file=sys.stderr)
 
-passive_df['date'] = passive_df['date'].astype(object)
-cor_data = (passive_df.corr(min_periods=5).stack()
-        .reset_index()   
-        .rename(columns={0: 'correlation', 'level_0': 'variable', 'level_1': 'variable2'}))
-cor_data['correlation_label'] = cor_data['correlation'].map('{:.2f}'.format)  # Round to 2 decimal
 
+# ### Quick notes about interpreting correlations:
+#
+# - The numbers and colors correspond to the strength of the relationship. A correlation of -1 indicates a perfect negative relationship (as one variable increases the other variable decreases), and a correlation of 1 indicates a perfect positive relationship (both variables are increasing or decreasing).
+# - A correlation of 0 means there is no linear relationship. However, just because a correlation is 0 does not necessarily mean there is no relationship there. There is always the possibility two variables have a nonlinear relationship.
+# - Correlation does not equal causation. This graph cannot show that one variable causes a change in another variable, only how changes in variables are associated with each other.
+#
+# Potential example of interpreting this graph: Maybe you have a negative correlation between mood and steps. A negative correlation indicates that on days when your steps are higher, your mood is higher/better. Questions to think about: How does going on a walk make you feel? Do you usually feel better, worse, or about the same after you go on walks?
 
-cor_data = cor_data[cor_data['correlation'] != 1.00]
+def build_correlation_matrix(passive_df):
+    cor_data = (passive_df.corr(min_periods=5, numeric_only=True).stack()
+            .reset_index()
+            .rename(columns={0: 'correlation', 'level_0': 'variable', 'level_1': 'variable2'}))
+    cor_data['correlation_label'] = cor_data['correlation'].map('{:.2f}'.format)  # Round to 2 decimal
 
-cor_data = cor_data[cor_data['correlation'] != -1.00]
+    cor_data = cor_data[cor_data['correlation'] != 1.00]
 
-base = alt.Chart(cor_data).transform_filter(
-alt.datum.variable > alt.datum.variable2
-).encode(
-    x='variable2:O',
-    y='variable:O'    
-)
+    cor_data = cor_data[cor_data['correlation'] != -1.00]
 
-text = base.mark_text().encode(
-    text='correlation_label',
-    color=alt.condition(
-        alt.datum.correlation > 0.5, 
-        alt.value('white'),
-        alt.value('black')
+    base = alt.Chart(cor_data).transform_filter(
+    alt.datum.variable > alt.datum.variable2
+    ).encode(
+        x='variable2:O',
+        y='variable:O'
     )
-)
 
+    text = base.mark_text().encode(
+        text='correlation_label',
+        color=alt.condition(
+            alt.datum.correlation > 0.5,
+            alt.value('white'),
+            alt.value('black')
+        )
+    )
 
-cor_plot = base.mark_rect().encode(
-    color='correlation:Q'
-).properties(
-    width=300,
-    height=200
-)
-cor_matrix = cor_plot + text
-
+    cor_plot = base.mark_rect().encode(
+        color='correlation:Q'
+    ).properties(
+        width=300,
+        height=200
+    )
+    return cor_plot + text
 
 
-cor_matrix
+def build_plot_df(passive_df):
+    plot_df = passive_df.rename(columns = {'difficulty functioning':'dysfunction'})
+    if pd.api.types.is_datetime64_any_dtype(plot_df['date']):
+        # The charts label days with Python dates (see build_passive_df)
+        plot_df['date'] = plot_df['date'].dt.date.astype(object)
+    for column in ('screen_duration', 'hometime'):
+        if column in plot_df:
+            plot_df[column] = plot_df[column]/3600000
+    return plot_df
 
 
 # ### Daily Survey Scores and Passive Data Features (Nearby Devices, Hometime, Screentime, Entropy)
-# 
+#
 # The below graphs display passive data features collected from your smarphone with your scores on your daily surveys measuring anxiety, function, and mood. The scale for the passive data features is on the left y-axis, and the scale for the daily surveys is on the right y-axis side. The goal of these graphs is to help display patterns between your passive data features and routines with your mood, anxiety, and function levels.
-# 
+#
 # For example, you may see that for days on which you were on your phone screen more, your mood was typically higher.
-# 
+#
 # * NOTE: Higher anxiety levels correspond with increased anxiety; 0 being no anxiety and 10 being the worst. Higher mood levels correspond with a better mood; 1 being the worst and 10 being the best. Higher function levels correspond with feeling like you are more able to manage day-to-day life on a scale of 0 to 4.
-# 
+#
 # Entropy is a measure of how much a participant moves around to different locations. Higher entropy typically means that the participant's time is more evenly split between different locations, while low entropy means that a person spends the vast majority of their time at one location.
-# 
+#
 # Nearby devices is a measure of, if your phone is turned on and connected to bluetooth, how many devices around you are also turned on and connected to bluetooth. It can be used as a measure of sociability. For example, if you are spending a lot of time in spaces with lots of people, like a concert or a busy coffee shop, there will be more people and devices around you.
 
-
-update_progress(progress_file, 70, "Creating graphs...")
-
-passive_df.rename(columns = {'difficulty functioning':'dysfunction'}, inplace = True)
-passive_df['screen_duration'] = passive_df['screen_duration']/3600000
-passive_df['hometime'] = passive_df['hometime']/3600000
-
-def generate_visibility(option_position, total_options, traces_per_option):
-    return [True if i // traces_per_option == option_position else False for i in range(total_options * traces_per_option)]
-
-x = passive_df['date']
-dep_line = passive_df['depression']
-anx_line = passive_df['anxiety']
-fxn_line = passive_df['dysfunction']
-
-# Create figure with secondary y-axis
-daily_fig = make_subplots(specs=[[{"secondary_y": True}]])
-# OPTION 1 = Screentime!!!
-daily_fig.add_trace(go.Bar(x=passive_df['date'], y=passive_df['screen_duration'], visible=True, marker=dict(color='#CCE5FF'), name='Screentime'), secondary_y=False)
-
-daily_fig.add_trace(go.Scatter(x=x, y=dep_line, mode='lines+markers', connectgaps=True, line=dict(width=2), visible=True, name='Depression'), secondary_y=True)
-daily_fig.add_trace(go.Scatter(x=x, y=anx_line, mode='lines+markers', connectgaps=True, visible=True, name='Anxiety'), secondary_y=True)
-daily_fig.add_trace(go.Scatter(x=x, y=fxn_line, mode='lines+markers', connectgaps=True, visible=True, name='Difficulty Functioning'), secondary_y=True)
-
-# OPTION 2 = Hometime!!!
-daily_fig.add_trace(go.Bar(x=passive_df['date'], y=passive_df['hometime'], visible=False, marker=dict(color='#CCCCFF'), name='Hometime'), secondary_y=False)
-
-daily_fig.add_trace(go.Scatter(x=x, y=dep_line, mode='lines+markers', connectgaps=True, line=dict(width=2), visible=False, name='Depression'), secondary_y=True)
-daily_fig.add_trace(go.Scatter(x=x, y=anx_line, mode='lines+markers', connectgaps=True, visible=False, name='Anxiety'), secondary_y=True)
-daily_fig.add_trace(go.Scatter(x=x, y=fxn_line, mode='lines+markers', connectgaps=True, visible=False, name='Difficulty Functioning'), secondary_y=True)
-
-# Option 3 = Entropy
-daily_fig.add_trace(go.Bar(x=passive_df['date'], y=passive_df['entropy'], visible=False, marker=dict(color='#CCFF99'), name='Entropy'), secondary_y=False)
-
-daily_fig.add_trace(go.Scatter(x=x, y=dep_line, mode='lines+markers', connectgaps=True, line=dict(width=2), visible=False, name='Depression'), secondary_y=True)
-daily_fig.add_trace(go.Scatter(x=x, y=anx_line, mode='lines+markers', connectgaps=True, visible=False, name='Anxiety'), secondary_y=True)
-daily_fig.add_trace(go.Scatter(x=x, y=fxn_line, mode='lines+markers', connectgaps=True, visible=False, name='Difficulty Functioning'), secondary_y=True)
-
-try:
-    ppl = cortex.secondary.nearby_device_count.nearby_device_count(id=part, start=start_date,
-                                                                    end=end_date, resolution=86400000)['data']
-    new_dict = {}
-    for timestamp in ppl['data']:
-        new_dict[(datetime.fromtimestamp(timestamp['timestamp'] / 1000)).date()] = timestamp['value']
-
-    df = pd.Series(new_dict)
-    df = pd.DataFrame(df.reset_index())
-    df.rename(columns={'index': 'timestamp', 0: 'value'}, inplace=True)
-
-    # adding nearby_devices OPTION 4
-    daily_fig.add_trace(go.Bar(x=df['timestamp'], y=df['value'], visible=False, marker=dict(color='#FFCC99'), name='Nearby Devices'), secondary_y=False)
-
-    daily_fig.add_trace(go.Scatter(x=x, y=dep_line, mode='lines+markers', connectgaps=True, line=dict(width=2), visible=False, name='Depression'), secondary_y=True)
-    daily_fig.add_trace(go.Scatter(x=x, y=anx_line, mode='lines+markers', connectgaps=True, visible=False, name='Anxiety'), secondary_y=True)
-    daily_fig.add_trace(go.Scatter(x=x, y=fxn_line, mode='lines+markers', connectgaps=True, visible=False, name='Difficulty Functioning'), secondary_y=True)
-
+def generate_visibility(option_position, total_options, shared_traces):
+    """Show only the selected passive bar; the shared survey lines stay visible for every option."""
+    return [i == option_position for i in range(total_options)] + [True] * shared_traces
+
+
+def build_daily_figure(plot_df, nearby_devices):
+    x = plot_df['date']
+
+    # (dropdown label, x, y, bar color) for each passive option that was pulled
+    options = [
+        (label, plot_df['date'], plot_df[column], color)
+        for label, column, color in [('Screentime', 'screen_duration', '#CCE5FF'),
+                                     ('Hometime', 'hometime', '#CCCCFF'),
+                                     ('Entropy', 'entropy', '#CCFF99')]
+        if column in plot_df
+    ]
+    if nearby_devices is not None:
+        options.append(('Nearby Devices', nearby_devices['timestamp'], nearby_devices['value'], '#FFCC99'))
+
+    # Create figure with secondary y-axis
+    daily_fig = make_subplots(specs=[[{"secondary_y": True}]])
+    for position, (label, bar_x, bar_y, color) in enumerate(options):
+        daily_fig.add_trace(go.Bar(x=bar_x, y=bar_y, visible=position == 0, marker=dict(color=color), name=label), secondary_y=False)
+
+    # The survey series are sent once and shared by every dropdown option.
+    survey_traces = [
+        go.Scatter(x=x, y=plot_df['depression'], mode='lines+markers', connectgaps=True, line=dict(width=2), name='Depression'),
+        go.Scatter(x=x, y=plot_df['anxiety'], mode='lines+markers', connectgaps=True, name='Anxiety'),
+        go.Scatter(x=x, y=plot_df['dysfunction'], mode='lines+markers', connectgaps=True, name='Difficulty Functioning'),
+    ]
+    for trace in survey_traces:
+        daily_fig.add_trace(trace, secondary_y=True)
 
     daily_fig.update_layout(
         updatemenus=[
@@ -437,273 +468,460 @@ try:
                 x=1.3,
                 y=0.5,
                 showactive=True,
-                buttons=list([
-                    dict(label="Screentime",
-                        method="update",
-                        args=[{"visible": generate_visibility(0, 4, 4)},
-                            {"title": "Screentime"}]),
-                    dict(label="Hometime",
+                buttons=[
+                    dict(label=label,
                         method="update",
-                        args=[{"visible": generate_visibility(1, 4, 4)},
-                            {"title": "Hometime"}]),
-                    dict(label="Entropy",
-                        method="update",
-                        args=[{"visible": generate_visibility(2, 4, 4)},
-                            {"title": "Entropy"}]),
-                    dict(label="Nearby Devices",
-                        method="update",
-                        args=[{"visible": generate_visibility(3, 4, 4)},
-                            {"title": "Nearby Devices"}])
-                ]),
+                        args=[{"visible": generate_visibility(position, len(options), len(survey_traces))},
+                            {"title": label}])
+                    for position, (label, _, _, _) in enumerate(options)
+                ],
             )
         ])
-except Exception as e:
-    print(f"Error: {e}")
-    daily_fig.update_layout(
-        updatemenus=[
-            dict(
-                type="dropdown",
-                x=1.3,
-                y=0.5,
-                showactive=True,
-                buttons=list([
-                    dict(label="Screentime",
-                        method="update",
-                        args=[{"visible": generate_visibility(0, 3, 4)},
-                            {"title": "Screentime"}]),
-                    dict(label="Hometime",
-                        method="update",
-                        args=[{"visible": generate_visibility(1, 3, 4)},
-                            {"title": "Hometime"}]),
-                    dict(label="Entropy",
-                        method="update",
-                        args=[{"visible": generate_visibility(2, 3, 4)},
-                            {"title": "Entropy"}])
-                ]),
-            )
-        ])
-
-# Set y-axes titles
-daily_fig.update_yaxes(title_text="<b>Survey Score</b>", secondary_y=True)
-daily_fig.update_yaxes(title_text="<b>Time/Number</b>", secondary_y=False)
 
+    # Set y-axes titles
+    daily_fig.update_yaxes(title_text="<b>Survey Score</b>", secondary_y=True)
+    daily_fig.update_yaxes(title_text="<b>Time/Number</b>", secondary_y=False)
+    return daily_fig
 
 
 # ### Steps, shown overlaid with daily anxiety, function, and mood scores.
-# 
+#
 # Steps are the number of steps you have taken each day, measured using your phone's accelerometer or health app.
 
-
-try:
+def build_steps_figure(plot_df):
+    if 'steps' not in plot_df:
+        print('No steps data for this participant.')
+        return None
     matplotlib.rc_file_defaults()
     import matplotlib.dates as mdates
 
     sns.set_style(style=None, rc=None)
 
     step_fig, ax1 = plt.subplots(figsize=(12,6))  # Renamed figure to step_fig
-    plt.xticks(rotation=45)
-
-    sns.barplot(data=passive_df, x='date', y='steps', alpha=0.5, ax=ax1, color='lightsalmon')
+    try:
+        plt.xticks(rotation=45)
 
-    ax2 = ax1.twinx()
-    plt.ylim(0, 10)
-    sns.lineplot(data=passive_df['anxiety'], marker='o', sort=False, ax=ax2, label='Anxiety', color='blueviolet')
-    sns.lineplot(data=passive_df['dysfunction'], marker='o', sort=False, ax=ax2, label='Difficulty Functioning', color='firebrick')
-    sns.lineplot(data=passive_df['depression'], marker='o', sort=False, ax=ax2, label='Depression', color='cornflowerblue')
+        sns.barplot(data=plot_df, x='date', y='steps', alpha=0.5, ax=ax1, color='lightsalmon')
 
-    ax2.set_ylabel('Survey Score')
-    ax1.set_ylabel('Steps')
-    ax1.set_xlabel('Date')
-    ax1.xaxis.set_major_locator(mdates.WeekdayLocator(interval=1))
+        ax2 = ax1.twinx()
+        plt.ylim(0, 10)
+        sns.lineplot(data=plot_df['anxiety'], marker='o', sort=False, ax=ax2, label='Anxiety', color='blueviolet')
+        sns.lineplot(data=plot_df['dysfunction'], marker='o', sort=False, ax=ax2, label='Difficulty Functioning', color='firebrick')
+        sns.lineplot(data=plot_df['depression'], marker='o', sort=False, ax=ax2, label='Depression', color='cornflowerblue')
 
-    colors = {'Steps': 'lightsalmon', 'Anxiety': 'blueviolet',
-            'Difficulty Functioning': 'firebrick', 'Depression': 'cornflowerblue'}
-    labels = list(colors.keys())
-    handles = [plt.Rectangle((0, 0), 1, 1, color=colors[label]) for label in labels]
-    plt.legend(handles, labels)
-except:
-    print('No step data for this participant. Maybe participant has low data quality or an Android.')
+        ax2.set_ylabel('Survey Score')
+        ax1.set_ylabel('Steps')
+        ax1.set_xlabel('Date')
+        ax1.xaxis.set_major_locator(mdates.WeekdayLocator(interval=1))
 
+        colors = {'Steps': 'lightsalmon', 'Anxiety': 'blueviolet',
+                'Difficulty Functioning': 'firebrick', 'Depression': 'cornflowerblue'}
+        labels = list(colors.keys())
+        handles = [plt.Rectangle((0, 0), 1, 1, color=colors[label]) for label in labels]
+        plt.legend(handles, labels)
+    except:
+        print('No step data for this participant. Maybe participant has low data quality or an Android.')
+    return step_fig
 
 
 # ### Calendar View
 
 # These calendars show heatmaps of all of your passive and active variables collected over your time in the clinic. The month is listed on the bottom, the day of the week is shown on the right, and there is a heat map scale on the far right showing the minimum and maximum values for each variable with the corresponding colors.
-# 
+#
 # The goal of these graphs is to help pick up on patterns in passive or active data over time, as well as to pick out what days may have been unusual in terms of passive or active data values.
 
-# #### Entropy
-
-
-
-final_df = passive_df
-
-# ---- Entropy Calendar Plot ----
-entropy_data = final_df[['date', 'entropy']]
-entropy_data['date'] = pd.to_datetime(entropy_data['date'], yearfirst=True)
-entropy_data.set_index('date', inplace=True)
-entropy_fig_cal = calplot.calplot(entropy_data['entropy'], textfiller='-', dropzero=True)
-
-# ---- Hometime Calendar Plot ----
-hometime_data = final_df[['date', 'hometime']]
-hometime_data['date'] = pd.to_datetime(hometime_data['date'], yearfirst=True)
-hometime_data.set_index('date', inplace=True)
-hometime_fig_cal = calplot.calplot(hometime_data['hometime'], textfiller='-', dropzero=True)
-
-# ---- Data Quality Calendar Plot ----
-data_quality_data = final_df[['date', 'data_quality']]
-data_quality_data['date'] = pd.to_datetime(data_quality_data['date'], yearfirst=True)
-data_quality_data.set_index('date', inplace=True)
-data_quality_fig_cal = calplot.calplot(data_quality_data['data_quality'], textfiller='-', dropzero=True)
-
-# ---- Screen Duration Calendar Plot ----
-screen_duration_data = final_df[['date', 'screen_duration']]
-screen_duration_data['date'] = pd.to_datetime(screen_duration_data['date'], yearfirst=True)
-screen_duration_data.set_index('date', inplace=True)
-screen_duration_fig_cal = calplot.calplot(screen_duration_data['screen_duration'], textfiller='-', dropzero=True)
-
-# ---- Steps Calendar Plot ----
-try:
-    steps_data = final_df[['date', 'steps']]
-    steps_data['date'] = pd.to_datetime(steps_data['date'], yearfirst=True)
-    steps_data.set_index('date', inplace=True)
-    steps_fig_cal = calplot.calplot(steps_data['steps'], textfiller='-', dropzero=True)
-except:
-    print('No step data for this participant.')
-
-# ---- Anxiety Calendar Plot ----
-anxiety_data = final_df[['date', 'anxiety']]
-anxiety_data['date'] = pd.to_datetime(anxiety_data['date'], yearfirst=True)
-anxiety_data.set_index('date', inplace=True)
-anxiety_fig_cal = calplot.calplot(anxiety_data['anxiety'], textfiller='-', dropzero=True)
+def build_calendar_data(plot_df):
+    """Return {metric: date-indexed Series} for every calendar metric present in ``plot_df``."""
+    calendar_data = {}
+    index = None  # one DatetimeIndex shared by every metric
+    for metric in CALENDAR_METRICS:
+        if metric not in plot_df:
+            print(f'No {metric} data for this participant.')
+            continue
+        if index is None:
+            index = pd.DatetimeIndex(pd.to_datetime(plot_df['date'], yearfirst=True))
+        calendar_data[metric] = pd.Series(plot_df[metric].values, index=index, name=metric)
+    return calendar_data
 
-# ---- Depression Calendar Plot ----
-depression_data = final_df[['date', 'depression']]
-depression_data['date'] = pd.to_datetime(depression_data['date'], yearfirst=True)
-depression_data.set_index('date', inplace=True)
-depression_fig_cal = calplot.calplot(depression_data['depression'], textfiller='-', dropzero=True)
 
-# ---- Dysfunction Calendar Plot ----
-dysfunction_data = final_df[['date', 'dysfunction']]
-dysfunction_data['date'] = pd.to_datetime(dysfunction_data['date'], yearfirst=True)
-dysfunction_data.set_index('date', inplace=True)
-dysfunction_fig_cal = calplot.calplot(dysfunction_data['dysfunction'], textfiller='-', dropzero=True)
+def render_calendars(calendar_data, low_memory=False):
+    """Render each calendar metric once, in parallel (empty string when the metric is missing).
 
+    Low-memory runs render in worker processes even on one CPU, keeping the
+    figures out of this process's peak.
+    """
+    calendar_html = {metric: '' for metric in CALENDAR_METRICS}
+    calendar_html.update(calendar_render.render_calendars(calendar_data, isolate=low_memory))
+    return calendar_html
 
 
 # #### Data Quality Over the Past Week
 
-update_progress(progress_file, 90, "Final touches...")
-
-data_qual=cortex.secondary.data_quality.data_quality(id=part, start=cortex.now()-7*MS_IN_DAY, 
-                                                    end=cortex.now(), resolution=86400000, 
-                                                    feature='accelerometer', bin_size=10000)['data']
-#dq of the last week~! 
-import plotly.graph_objects as go
-last_week=data_qual[-7:]
-dq=[day['value'] for day in last_week]
-avg_dq=sum(dq)/7
-dqwheel_fig = go.Figure(go.Indicator(
-    domain = {'x': [0, 1], 'y': [0, 1]},
-    value = avg_dq,
-    # mode = "gauge+number+delta",
-    mode='gauge+number',
-    title = {'text': "Average Data Quality in the Past Week"},
-    delta = {'reference': .44},
-    gauge = {'axis': {'range': [None, 1]},
-            'bar': {'color': "black", 'line': {'color':'red', 'width':0}, 'thickness': .1},
-            'shape': 'angular',
-            'steps' : [
-                {'range': [0, .35], 'color': "#E74C3C"},
-                {'range': [.35, .6], 'color': "#F4D03F"},
-                {'range': [.6, .8], 'color': "#27AE60"},
-                {'range': [.8, 1], 'color': "#2471A3"}]}))
-
-
-# Generate HTML for figures
-correlation_matrix_html = cor_matrix.to_html()
-daily_scores_html = pio.to_html(daily_fig, full_html=False)
-
-
-def fig_to_html(fig):
-    """Convert a Matplotlib figure to a base64-encoded HTML image tag."""
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png")
-    buf.seek(0)
-    encoded_fig = base64.b64encode(buf.read()).decode("utf-8")
-    buf.close()
-    return f'<img src="data:image/png;base64,{encoded_fig}">'
-
-# Generate and convert figures to HTML
-entropy_fig_cal, _ = calplot.calplot(entropy_data['entropy'], textfiller='-', dropzero=True)
-entropy_fig_cal_html = fig_to_html(entropy_fig_cal)
-
-hometime_fig_cal, _ = calplot.calplot(hometime_data['hometime'], textfiller='-', dropzero=True)
-hometime_fig_cal_html = fig_to_html(hometime_fig_cal)
-
-data_quality_fig_cal, _ = calplot.calplot(data_quality_data['data_quality'], textfiller='-', dropzero=True)
-data_quality_fig_cal_html = fig_to_html(data_quality_fig_cal)
-
-screen_duration_fig_cal, _ = calplot.calplot(screen_duration_data['screen_duration'], textfiller='-', dropzero=True)
-screen_duration_fig_cal_html = fig_to_html(screen_duration_fig_cal)
-
-steps_fig_cal, _ = calplot.calplot(steps_data['steps'], textfiller='-', dropzero=True)
-steps_fig_cal_html = fig_to_html(steps_fig_cal)
-
-anxiety_fig_cal, _ = calplot.calplot(anxiety_data['anxiety'], textfiller='-', dropzero=True)
-anxiety_fig_cal_html = fig_to_html(anxiety_fig_cal)
-
-depression_fig_cal, _ = calplot.calplot(depression_data['depression'], textfiller='-', dropzero=True)
-depression_fig_cal_html = fig_to_html(depression_fig_cal)
-
-dysfunction_fig_cal, _ = calplot.calplot(dysfunction_data['dysfunction'], textfiller='-', dropzero=True)
-dysfunction_fig_cal_html = fig_to_html(dysfunction_fig_cal)
-
-dqwheel_fig = pio.to_html(dqwheel_fig, full_html=False)
-
-steps_graph_html = fig_to_html(step_fig)
-
-# Create the complete HTML content
-html_content = f"""
+def build_dq_wheel(week_data_quality):
+    dq=[day['value'] for day in week_data_quality]
+    avg_dq=sum(dq)/7
+    dqwheel_fig = go.Figure(go.Indicator(
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        value = avg_dq,
+        # mode = "gauge+number+delta",
+        mode='gauge+number',
+        title = {'text': "Average Data Quality in the Past Week"},
+        delta = {'reference': .44},
+        gauge = {'axis': {'range': [None, 1]},
+                'bar': {'color': "black", 'line': {'color':'red', 'width':0}, 'thickness': .1},
+                'shape': 'angular',
+                'steps' : [
+                    {'range': [0, .35], 'color': "#E74C3C"},
+                    {'range': [.35, .6], 'color': "#F4D03F"},
+                    {'range': [.6, .8], 'color': "#27AE60"},
+                    {'range': [.8, 1], 'color': "#2471A3"}]}))
+    return dqwheel_fig
+
+
+def build_static_daily_html(daily_fig, pdf_renderer):
+    """Render one static image per dropdown option of the interactive daily chart."""
+    images = []
+    for button in daily_fig.layout.updatemenus[0].buttons:
+        option_fig = go.Figure(daily_fig)
+        option_fig.layout.updatemenus = ()
+        option_fig.update_layout(title=button.args[1]['title'])
+        for trace, visible in zip(option_fig.data, button.args[0]['visible']):
+            trace.visible = visible
+        images.append(pdf_renderer.plotly_html(option_fig))
+    return '\n    '.join(images)
+
+
+# ---------- Report Sections ----------
+# The page is streamed section by section (see output_sink.SectionWriter), in this order.
+
+REPORT_SECTIONS = ['intro', 'correlation', 'daily', 'steps', 'calendar', 'data_quality']
+
+REPORT_HEADER = """
 <html>
 <head>
     <title>Report</title>
 </head>
 <body>
     <h1>Participant Report</h1>
-    <p>This document presents the data that was collected during your time during the social media study. You can keep this document for your records or use it as a reference when working with a new clinician or health provider. Feel free to reach out to the study team (jburns9@bidmc.harvard.edu) with any questions.</p>
-    <h2>Correlation Matrix</h2>
-    {correlation_matrix_html}
-    <h2>Daily Survey Scores and Passive Data Features</h2>
-    {daily_scores_html}
-    <h2>Steps</h2>
-    {steps_graph_html}
-    <h2>Calendar View</h2>
-    <p>---- Entropy Calendar Plot ----</p>
-    {entropy_fig_cal_html}
-    <p>---- Hometime Calendar Plot ----</p>
-    {hometime_fig_cal_html}
-    <p>---- Data Quality Calendar Plot ----</p>
-    {data_quality_fig_cal_html}
-    <p>---- Screen Duration Calendar Plot ----</p>
-    {screen_duration_fig_cal_html}
-    <p>---- Steps Calendar Plot ----</p>
-    {steps_fig_cal_html}
-    <p>---- Anxiety Calendar Plot ----</p>
-    {anxiety_fig_cal_html}
-    <p>---- Depression Calendar Plot ----</p>
-    {depression_fig_cal_html}
-    <p>---- Dysfunction Calendar Plot ----</p>
-    {dysfunction_fig_cal_html}
-    <h2>Data Quality for the past week<h2>
-    {dqwheel_fig}
+"""
+
+REPORT_FOOTER = """
 </body>
 </html>
 """
 
-update_progress(progress_file, 100, "yippee")
+CALENDAR_TITLES = {
+    'entropy': 'Entropy',
+    'hometime': 'Hometime',
+    'data_quality': 'Data Quality',
+    'screen_duration': 'Screen Duration',
+    'steps': 'Steps',
+    'anxiety': 'Anxiety',
+    'depression': 'Depression',
+    'dysfunction': 'Dysfunction',
+}
+
+
+def intro_section(passive_df, pull_stats=None):
+    html = """    <p>This document presents the data that was collected during your time during the social media study. You can keep this document for your records or use it as a reference when working with a new clinician or health provider. Feel free to reach out to the study team (jburns9@bidmc.harvard.edu) with any questions.</p>
+"""
+    if pull_stats and pull_stats.failed:
+        html += (f"    <p><b>Note:</b> some passive data could not be retrieved "
+                 f"({', '.join(sorted(pull_stats.failed))}); those charts are left out.</p>\n")
+    return html
+
+
+def correlation_section(cor_matrix, output_format='html', pdf_renderer=None):
+    if output_format == 'pdf':
+        correlation_matrix_html = pdf_renderer.altair_html(cor_matrix)
+    else:
+        correlation_matrix_html = cor_matrix.to_html()
+    return f"    <h2>Correlation Matrix</h2>\n    {correlation_matrix_html}\n"
+
+
+def daily_section(daily_fig, output_format='html', pdf_renderer=None):
+    if output_format == 'pdf':
+        daily_scores_html = build_static_daily_html(daily_fig, pdf_renderer)
+    else:
+        daily_scores_html = pio.to_html(daily_fig, full_html=False)
+        print(f"[INFO] Daily chart payload: {len(daily_fig.to_json()) / 1024:.1f} KiB of figure data "
+              f"in {len(daily_fig.data)} traces", file=sys.stderr)
+    return f"    <h2>Daily Survey Scores and Passive Data Features</h2>\n    {daily_scores_html}\n"
+
+
+def steps_section(step_fig):
+    if step_fig is None:
+        return ''
+    try:
+        steps_graph_html = fig_to_html(step_fig)
+    finally:
+        plt.close(step_fig)
+    return f"    <h2>Steps</h2>\n    {steps_graph_html}\n"
+
+
+def calendar_section(calendar_html):
+    metrics = [metric for metric in CALENDAR_METRICS if calendar_html[metric]]
+    if not metrics:
+        return ''
+    parts = ["    <h2>Calendar View</h2>\n"]
+    for metric in metrics:
+        parts.append(f"    <p>---- {CALENDAR_TITLES[metric]} Calendar Plot ----</p>\n    {calendar_html[metric]}\n")
+    return ''.join(parts)
+
+
+def data_quality_section(dqwheel_fig, output_format='html', pdf_renderer=None):
+    if output_format == 'pdf':
+        dqwheel_html = pdf_renderer.plotly_html(dqwheel_fig, width=600, height=400)
+    else:
+        # plotly.js is already inlined by the daily chart above; don't ship it twice.
+        dqwheel_html = pio.to_html(dqwheel_fig, full_html=False, include_plotlyjs=False)
+    return f"    <h2>Data Quality for the past week<h2>\n    {dqwheel_html}"
+
+
+def section_stage(name, render, inputs):
+    """A stage that renders one report section and hands it to the writer right away."""
+    def write_section(writer, **render_inputs):
+        writer.write(name, render(**render_inputs))
+
+    return Stage(f'{name}_section', write_section, inputs=('writer',) + tuple(inputs))
+
+
+# ---------- Stage Graph ----------
+# Every stage declares the context keys it reads and writes; run_stages starts a
+# stage as soon as its inputs exist, so the three cortex pulls overlap and the
+# report costs roughly the slowest pull rather than the sum of all of them.
+# Checkpointed stages are the expensive ones (pulls, calendar renders); a retried
+# task restores them instead of starting over. Inline stages run in list order,
+# so each section stage sits right after the figure it writes: the page streams
+# out as figures are made, and each figure is released once its section is out.
+
+def build_stages():
+    return [
+        Stage('pull_passive', pull_passive,
+              inputs=('participant_id', 'start_ts', 'end_ts', 'feature_cache', 'low_memory', 'pull_stats', 'timer'),
+              outputs=('passive',),
+              concurrent=True, progress=(70, "Passive Data Pull Complete!"), checkpoint=True),
+        Stage('pull_survey_scores', pull_survey_scores,
+              inputs=('participant_id', 'start_ts', 'end_ts', 'pull_stats', 'timer'), outputs=('survey_responses',),
+              concurrent=True, checkpoint=True),
+        Stage('pull_week_data_quality', pull_week_data_quality,
+              inputs=('participant_id', 'end_ts', 'pull_stats', 'timer'), outputs=('week_data_quality',),
+              concurrent=True, checkpoint=True),
+        Stage('nearby_devices', nearby_devices_from_passive,
+              inputs=('passive',), outputs=('nearby_devices',)),
+        Stage('build_passive_df', build_passive_df,
+              inputs=('passive', 'survey_responses', 'low_memory'), outputs=('passive_df',),
+              checkpoint=True),
+        Stage('store_daily_features', store_daily_features,
+              inputs=('participant_id', 'passive_df', 'feature_store'),
+              concurrent=True, checkpoint=True),
+        section_stage('intro', intro_section, inputs=('passive_df', 'pull_stats')),
+        Stage('correlation_matrix', build_correlation_matrix,
+              inputs=('passive_df',), outputs=('cor_matrix',)),
+        section_stage('correlation', correlation_section, inputs=('cor_matrix', 'output_format', 'pdf_renderer')),
+        Stage('plot_df', build_plot_df,
+              inputs=('passive_df',), outputs=('plot_df',),
+              progress=(70, "Creating graphs...")),
+        Stage('daily_figure', build_daily_figure,
+              inputs=('plot_df', 'nearby_devices'), outputs=('daily_fig',)),
+        section_stage('daily', daily_section, inputs=('daily_fig', 'output_format', 'pdf_renderer')),
+        Stage('steps_figure', build_steps_figure,
+              inputs=('plot_df',), outputs=('step_fig',)),
+        section_stage('steps', steps_section, inputs=('step_fig',)),
+        Stage('calendar_data', build_calendar_data,
+              inputs=('plot_df',), outputs=('calendar_data',)),
+        Stage('render_calendars', render_calendars,
+              inputs=('calendar_data', 'low_memory'), outputs=('calendar_html',),
+              progress=(90, "Final touches..."), checkpoint=True),
+        section_stage('calendar', calendar_section, inputs=('calendar_html',)),
+        Stage('dq_wheel', build_dq_wheel,
+              inputs=('week_data_quality',), outputs=('dqwheel_fig',)),
+        section_stage('data_quality', data_quality_section, inputs=('dqwheel_fig', 'output_format', 'pdf_renderer')),
+    ]
+
+
+def sidecar_path(output_path, suffix):
+    """``report.html`` -> ``report<suffix>``, for local paths and ``s3://`` URLs alike."""
+    return os.path.splitext(output_path)[0] + suffix
+
+
+def generate_report(participant_id, start_date, output_format, output_path, progress=None,
+                    feature_cache=None, feature_store=None, pdf_renderer=None, timer=None,
+                    low_memory=LOW_MEMORY, checkpoint=None):
+    timer = timer or StageTimer()
+    progress = open_progress(progress)
+    progress.update(30, "Survey Scoring")
+    progress.update(40, "Pulling passive data...")
+
+    context = {
+        'participant_id': participant_id,
+        # default end date is now
+        'start_ts': timestamp(start_date),
+        'end_ts': cortex.now(),
+        'feature_cache': feature_cache,
+        'feature_store': feature_store,
+        'output_format': output_format,
+        'low_memory': low_memory,
+        'pull_stats': PullStats(),
+        'timer': timer,  # the pulls time each shard under it
+        'pdf_renderer': pdf_renderer if pdf_renderer or output_format != 'pdf' else get_renderer(),
+    }
+
+    if checkpoint is not None:
+        # A resumed task keeps the first attempt's end time so restored and fresh stages agree.
+        context.update(checkpoint.open(
+            {'participant_id': participant_id, 'start_date': start_date, 'output_format': output_format},
+            {'end_ts': context['end_ts']}))
+        # pull_passive is the only stage that tolerates failed features; a restored
+        # pull brings back the ones its first attempt could not get.
+        pull_stats = context['pull_stats']
+        checkpoint.carry('pull_passive', lambda: {'failed_features': dict(pull_stats.failed)})
+        pull_stats.add_failed(checkpoint.carried('pull_passive').get('failed_features', {}))
+
+    def on_stage_complete(stage):
+        if stage.progress:
+            progress.update(*stage.progress)
+
+    # HTML streams straight to its destination. PDF pages go to a local HTML
+    # file first, since wkhtmltopdf converts from disk at the end.
+    if output_format == 'pdf':
+        fd, page_path = tempfile.mkstemp(prefix='lamp-report-', suffix='.html')
+        os.close(fd)
+        page_sink = LocalFileSink(page_path)
+    else:
+        page_sink = open_sink(output_path)
+    writer = SectionWriter(page_sink, REPORT_SECTIONS, header=REPORT_HEADER, footer=REPORT_FOOTER)
+    context['writer'] = writer
+    try:
+        try:
+            context = run_stages(build_stages(), context, on_stage_complete=on_stage_complete, timer=timer,
+                                 release=True, checkpoint=checkpoint)
+            with timer.measure('write_output'):
+                writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+        if output_format == 'pdf':
+            pdf_sink = open_sink(output_path)
+            try:
+                with timer.measure('write_pdf'):
+                    context['pdf_renderer'].write_pdf_file(page_path, pdf_sink)
+                    pdf_sink.commit()
+            except BaseException:
+                pdf_sink.abort()
+                raise
+    finally:
+        if output_format == 'pdf':
+            # The temporary page holds participant data; remove it (and its .partial) however the run ends.
+            for path in (page_path, page_sink.partial_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    if checkpoint is not None:
+        checkpoint.clear()
+    progress.update(100, "yippee")
+    print(f"[INFO] Peak RSS: {peak_rss_mb()} MiB{' (low-memory mode)' if low_memory else ''}", file=sys.stderr)
+
+    metadata = {'participant_id': participant_id, 'start_date': start_date, 'output_format': output_format,
+                'low_memory': low_memory, 'pulls': context['pull_stats'].as_dict()}
+    timer.write(sidecar_path(output_path, '.timings.json'), **metadata)
 
 
-# Save the HTML content to a file
-with open(output_path, "w") as file:
-    file.write(html_content)
\ No newline at end of file
+# ---------- Argument Parsing ----------
+def add_storage_arguments(parser):
+    # Both hold participant data on local disk, so they stay off unless a directory is given.
+    parser.add_argument('--cache_dir', default=os.getenv("REPORT_CACHE_DIR"),
+                        help="Directory for the incremental cortex feature cache; off unless given "
+                             "(env REPORT_CACHE_DIR)")
+    parser.add_argument('--no_cache', action='store_true', help="Ignore REPORT_CACHE_DIR and pull the full history")
+    parser.add_argument('--store_dir', default=os.getenv("REPORT_STORE_DIR"),
+                        help="Directory of the Parquet daily feature store; off unless given "
+                             "(env REPORT_STORE_DIR)")
+    parser.add_argument('--no_store', action='store_true', help="Ignore REPORT_STORE_DIR and store nothing")
+
+
+def storage_from_args(args):
+    """Return the (feature_cache, feature_store) selected by ``add_storage_arguments`` flags."""
+    feature_cache = None
+    if args.cache_dir and not args.no_cache:
+        feature_cache = FeatureCache(args.cache_dir)
+    feature_store = None
+    if args.store_dir and not args.no_store:
+        if HAVE_PYARROW:
+            feature_store = DailyFeatureStore(args.store_dir)
+        else:
+            print("[WARN] pyarrow is not installed; daily features will not be stored", file=sys.stderr)
+    return feature_cache, feature_store
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate LAMP report.")
+    parser.add_argument('--participant_id', required=True)
+    parser.add_argument('--start_date', required=True)
+    parser.add_argument('--output_format', choices=['html', 'pdf'], required=True)
+    parser.add_argument('--output_path', required=True)
+    parser.add_argument('--progress_file', required=False,
+                        help="Path or s3://bucket/key to write progress updates")
+    parser.add_argument('--task_id', default=os.getenv("TASK_ID"),
+                        help="Key checkpoints by this ID so a retry of the same task resumes (env TASK_ID)")
+    parser.add_argument('--checkpoint_dir', default=os.getenv("REPORT_CHECKPOINT_DIR"),
+                        help="Directory or s3://bucket/prefix for stage checkpoints; off unless given "
+                             "(env REPORT_CHECKPOINT_DIR)")
+    parser.add_argument('--low_memory', action='store_true', default=LOW_MEMORY,
+                        help="Reduce raw step samples to daily rows as soon as they are pulled (env REPORT_LOW_MEMORY=1)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Write a cProfile of the report run to <output>.prof")
+    add_storage_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print(f"[INFO] Progress file: {args.progress_file}")
+    progress = open_progress(args.progress_file)
+
+    timer = StageTimer()
+    timer.add('imports', *IMPORT_TIMES)
+    with timer.measure('connect'):
+        connect()
+    progress.update(10, "Packages generated")
+
+    feature_cache, feature_store = storage_from_args(args)
+
+    checkpoint = None
+    if args.checkpoint_dir and args.task_id:
+        checkpoint = StageCheckpoint(args.checkpoint_dir, args.task_id)
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        # Python 3.12's profiler sees every thread, so the concurrent pulls are included.
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        generate_report(args.participant_id, args.start_date, args.output_format,
+                        args.output_path, progress=progress,
+                        feature_cache=feature_cache, feature_store=feature_store, timer=timer,
+                        low_memory=args.low_memory, checkpoint=checkpoint)
+    except Exception as e:
+        progress.update(-1, f"Failed: {e}")
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            profile_path = sidecar_path(args.output_path, '.prof')
+            if profile_path.startswith('s3://'):
+                fd, local_path = tempfile.mkstemp(suffix='.prof')
+                os.close(fd)
+                profiler.dump_stats(local_path)
+                upload_file(local_path, profile_path)
+                os.remove(local_path)
+            else:
+                profiler.dump_stats(profile_path)
+            print(f"[INFO] Profile written to {profile_path} (open with snakeviz or pstats)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Long-lived report worker with a warm interpreter.
+
+The worker imports the generator (pandas, matplotlib, plotly, cortex, ...) and
+calls ``LAMP.connect()`` once, then takes report jobs from a local queue and
+runs each one in a forked child that inherits the already-initialised
+interpreter. A report's time-to-first-byte no longer includes the imports.
+
+Jobs are JSON objects with the same fields as the generator's CLI flags:
+
+    {"participant_id": "U0123456789", "start_date": "2024-01-01",
+     "output_format": "html", "output_path": "out/U0123456789.html",
+     "progress_file": "out/U0123456789.json", "job_id": "optional"}
+
+Queues:
+    --stdin            one job per line on stdin; a result line per job on stdout.
+                       The worker exits once stdin is closed and all jobs finished.
+    --queue_dir DIR    spool directory; drop ``<job_id>.json`` files in it. Jobs are
+                       claimed by renaming to ``<job_id>.<pid>.running`` and finish as
+                       ``.done`` or ``.failed`` with the result merged in. Claims left
+                       by a dead worker are requeued at startup. Runs until SIGTERM/SIGINT.
+
+Usage:
+    python report_worker.py --queue_dir /tmp/report-jobs --max_children 2
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import selectors
+import traceback
+
+from report_generator import (
+    connect,
+    generate_report,
+    add_storage_arguments,
+    storage_from_args,
+)
+from progress_sink import open_progress
+
+JOB_FIELDS = ('participant_id', 'start_date', 'output_format', 'output_path')
+
+
+class StdinJobSource:
+    """Reads one JSON job per line from stdin without blocking the reaper.
+
+    The fd is read directly: lines left in a buffered reader would never make
+    ``select`` fire, so a second job arriving in the same write as the first
+    would wait until stdin closed.
+    """
+
+    def __init__(self, stream=sys.stdin):
+        self.fd = stream.fileno()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+        self.buffer = b''
+        self.eof = False
+
+    @property
+    def closed(self):
+        return self.eof and not self.buffer
+
+    def _next_line(self):
+        line, newline, rest = self.buffer.partition(b'\n')
+        if newline:
+            self.buffer = rest
+            return line
+        if self.eof:
+            # Last line without a trailing newline
+            self.buffer = b''
+            return line
+        return None
+
+    def next_job(self, timeout: float):
+        line = self._next_line()
+        if line is None:
+            if self.eof or not self.selector.select(timeout):
+                return None
+            data = os.read(self.fd, 65536)
+            if data:
+                self.buffer += data
+            else:
+                self.eof = True
+                self.selector.unregister(self.fd)
+            line = self._next_line()
+            if line is None:
+                return None
+        line = line.strip()
+        return json.loads(line) if line else None
+
+    def finish(self, job: dict, result: dict):
+        print(json.dumps(result), flush=True)
+
+
+class SpoolJobSource:
+    """Claims ``*.json`` job files from a directory by renaming them.
+
+    A claimed job is ``<job_id>.<worker pid>.running``; claims whose worker is
+    no longer alive (it crashed or was killed) are put back as ``.json``.
+    """
+
+    def __init__(self, queue_dir: str):
+        self.queue_dir = queue_dir
+        self.closed = False
+        os.makedirs(queue_dir, exist_ok=True)
+        self.reclaim_stale()
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def reclaim_stale(self):
+        """Return jobs claimed by dead workers to the queue."""
+        for name in os.listdir(self.queue_dir):
+            if not name.endswith('.running'):
+                continue
+            job_id, _, pid = name[:-len('.running')].rpartition('.')
+            if job_id and pid.isdigit() and int(pid) != os.getpid() and not self._alive(int(pid)):
+                try:
+                    os.rename(os.path.join(self.queue_dir, name), os.path.join(self.queue_dir, f"{job_id}.json"))
+                    print(f"[WARN] Requeued job {job_id} left running by worker {pid}", file=sys.stderr)
+                except OSError:
+                    pass  # another worker reclaimed it first
+
+    def next_job(self, timeout: float):
+        for name in sorted(os.listdir(self.queue_dir)):
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            path = os.path.join(self.queue_dir, name)
+            claimed = os.path.join(self.queue_dir, f"{job_id}.{os.getpid()}.running")
+            try:
+                os.rename(path, claimed)  # atomic claim; another worker may win
+            except OSError:
+                continue
+            with open(claimed) as f:
+                job = json.load(f)
+            job.setdefault('job_id', job_id)
+            job['_claimed_path'] = claimed
+            job['_spool_id'] = job_id
+            return job
+        time.sleep(timeout)
+        return None
+
+    def finish(self, job: dict, result: dict):
+        claimed = job.get('_claimed_path')
+        if not claimed:
+            return
+        final = os.path.join(self.queue_dir, job['_spool_id'] + ('.done' if result['status'] == 'done' else '.failed'))
+        record = {key: value for key, value in job.items() if not key.startswith('_')}
+        record['result'] = result
+        with open(claimed, 'w') as f:
+            json.dump(record, f)
+        os.replace(claimed, final)
+
+
+def run_child(job: dict, storage) -> int:
+    """Body of the forked child: generate one report and return the exit code."""
+    feature_cache, feature_store = storage
+    progress = open_progress(job.get('progress_file'))
+    try:
+        generate_report(job['participant_id'], job['start_date'], job['output_format'],
+                        job['output_path'], progress=progress,
+                        feature_cache=feature_cache, feature_store=feature_store)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        progress.update(-1, f"Failed: {e}")
+        return 1
+
+
+def fork_job(job: dict, storage) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.dup2(sys.stderr.fileno(), sys.stdout.fileno())  # stdout carries results in --stdin mode
+            code = run_child(job, storage)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+
+def serve(source, storage, max_children: int = 1, poll_interval: float = 0.5):
+    """Dispatch jobs from ``source`` to forked children until it is exhausted or stopped."""
+    children = {}  # pid -> (job, started)
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def finish(pid, status):
+        job, started = children.pop(pid)
+        code = os.waitstatus_to_exitcode(status)
+        result = {
+            'job_id': job.get('job_id'),
+            'participant_id': job.get('participant_id'),
+            'status': 'done' if code == 0 else 'failed',
+            'exit_code': code,
+            'seconds': round(time.time() - started, 2),
+        }
+        source.finish(job, result)
+
+    while children or not (stopping or source.closed):
+        while children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            finish(pid, status)
+
+        if stopping or source.closed or len(children) >= max_children:
+            if children:
+                try:
+                    pid, status = os.waitpid(-1, 0)
+                    finish(pid, status)
+                except (ChildProcessError, InterruptedError):
+                    pass
+            continue
+
+        try:
+            job = source.next_job(poll_interval)
+        except (ValueError, OSError) as e:
+            print(f"[ERROR] Skipping unreadable job: {e}", file=sys.stderr)
+            continue
+        if job is None:
+            continue
+        missing = [field for field in JOB_FIELDS if not job.get(field)]
+        if missing:
+            source.finish(job, {'job_id': job.get('job_id'), 'status': 'failed',
+                                'error': f"missing fields: {', '.join(missing)}"})
+            continue
+        children[fork_job(job, storage)] = (job, time.time())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve LAMP report jobs from a warm, preloaded worker.")
+    queue = parser.add_mutually_exclusive_group(required=True)
+    queue.add_argument('--stdin', action='store_true', help="Read JSON jobs from stdin, one per line")
+    queue.add_argument('--queue_dir', help="Spool directory of <job_id>.json files")
+    parser.add_argument('--max_children', type=int, default=1, help="Reports generated at the same time")
+    parser.add_argument('--poll_interval', type=float, default=0.5)
+    add_storage_arguments(parser)
+    args = parser.parse_args(argv)
+
+    connect()
+    storage = storage_from_args(args)
+    source = StdinJobSource() if args.stdin else SpoolJobSource(args.queue_dir)
+    print(f"[INFO] Report worker {os.getpid()} ready", file=sys.stderr, flush=True)
+    serve(source, storage, max_children=max(1, args.max_children), poll_interval=args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Time-sharded cortex pulls.
+
+A multi-year enrollment used to be one cortex request: latency grew with the
+study length and one transient error threw the whole pull away. ``pull_sharded``
+splits ``start``..``end`` into fixed windows of whole days, fetches them on a
+bounded thread pool, retries each window on its own and stitches the results
+back together in time order.
+
+Windows start at ``start`` and are whole days long, so day-binned features
+(resolution 86400000) get exactly the bins a single request would have.
+
+Every request, from any pull in the process, holds one slot of a shared
+semaphore (REPORT_MAX_REQUESTS), so features x shards cannot flood the server.
+Retries and per-feature failures are counted in a ``PullStats``.
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+MS_IN_DAY = 86400000
+
+SHARD_DAYS = int(os.getenv("REPORT_SHARD_DAYS", 90))
+SHARD_WORKERS = int(os.getenv("REPORT_SHARD_WORKERS", 4))
+SHARD_RETRIES = int(os.getenv("REPORT_SHARD_RETRIES", 2))
+MAX_REQUESTS = int(os.getenv("REPORT_MAX_REQUESTS", 8))
+
+_request_slots = threading.BoundedSemaphore(MAX_REQUESTS)
+
+
+class PullStats:
+    """Thread-safe counters for one report's pulls: retries, time they cost, failed features."""
+
+    def __init__(self):
+        self.retries = 0
+        self.retry_s = 0.0  # failed attempts plus backoff, summed over shards
+        self.failed = {}  # feature -> error message
+        self._lock = threading.Lock()
+
+    def retried(self, seconds: float):
+        with self._lock:
+            self.retries += 1
+            self.retry_s += seconds
+
+    def feature_failed(self, feature: str, error: Exception):
+        with self._lock:
+            self.failed[feature] = f"{type(error).__name__}: {error}"
+
+    def add_failed(self, failed: dict):
+        """Merge {feature: error message} recorded elsewhere, e.g. by a checkpointed attempt."""
+        with self._lock:
+            self.failed.update(failed)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {'retries': self.retries, 'retry_s': round(self.retry_s, 3),
+                    'failed_features': dict(self.failed)}
+
+
+def time_shards(start: int, end: int, shard_days: int = SHARD_DAYS):
+    """Split ``start``..``end`` (ms) into consecutive windows of at most ``shard_days``."""
+    step = max(1, shard_days) * MS_IN_DAY
+    return [(shard_start, min(shard_start + step, end)) for shard_start in range(start, end, step)]
+
+
+def merge_frames(results):
+    """Stitch per-shard ``{feature: DataFrame}`` results, keeping features any shard returned."""
+    merged = {}
+    for result in results:
+        for feature, frame in result.items():
+            merged.setdefault(feature, []).append(frame)
+    return {feature: frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+            for feature, frames in merged.items()}
+
+
+def merge_lists(results):
+    return [item for result in results for item in result]
+
+
+def _with_retries(pull, shard, retries: int, backoff: float, label: str, stats: PullStats = None):
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            with _request_slots:
+                return pull(*shard)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"[WARN] {label} shard {shard} failed ({e}); retry {attempt + 1}/{retries} in {delay:.0f}s",
+                  file=sys.stderr)
+            if stats:
+                stats.retried(time.perf_counter() - started + delay)
+            time.sleep(delay)
+
+
+def _timed(name: str, timer, func, *args):
+    with timer.measure(name) if timer else nullcontext():
+        return func(*args)
+
+
+def pull_sharded(pull, start: int, end: int, merge, label: str = 'pull', shard_days: int = SHARD_DAYS,
+                 max_workers: int = SHARD_WORKERS, retries: int = SHARD_RETRIES, backoff: float = 1.0,
+                 stats: PullStats = None, timer=None):
+    """Run ``pull(shard_start, shard_end)`` over time shards and ``merge`` the results in time order.
+
+    A shard that still fails after ``retries`` retries fails the whole pull;
+    the others are not re-fetched by the retry. With a ``timer``
+    (``stage_timing.StageTimer``), each shard, retries included, is recorded
+    as ``<label> shard <i>/<n>`` (just ``<label>`` when there is one shard).
+    """
+    shards = time_shards(start, end, shard_days)
+    if len(shards) <= 1:
+        return merge([_timed(label, timer, _with_retries, pull, (start, end), retries, backoff, label, stats)])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as pool:
+        futures = [pool.submit(_timed, f"{label} shard {i}/{len(shards)}", timer,
+                               _with_retries, pull, shard, retries, backoff, label, stats)
+                   for i, shard in enumerate(shards, 1)]
+        return merge([future.result() for future in futures])
@@ -0,0 +1,84 @@
+"""Per-stage timing for the report generators.
+
+``StageTimer.measure(name)`` records, for one block of work, its wall time, the
+CPU time of the thread that ran it, the CPU time of child processes that
+finished meanwhile (the calendar render pool) and the process's peak RSS. The
+stage runner wraps every stage in it, ``pull_sharded`` each cortex shard, and
+the generator adds the steps outside the stage graph (imports, connect,
+writing the output). ``write`` dumps the
+lot as JSON next to the report (a local path or an ``s3://`` URL).
+
+Peak RSS is a process-wide high-water mark, so ``rss_growth_mb`` is only
+attributed to a stage when it pushed the mark up; with concurrent pulls the
+overlap makes that approximate. Child CPU is likewise process-wide.
+"""
+
+import sys
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+from output_sink import write_artifact
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageTimer:
+    """Collects timing records for the stages of one report run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, wall: float, cpu: float = None, **extra):
+        """Record a stage that was timed elsewhere (e.g. the module imports)."""
+        record = {'stage': name, 'wall_s': round(wall, 3)}
+        if cpu is not None:
+            record['cpu_s'] = round(cpu, 3)
+        record['peak_rss_mb'] = peak_rss_mb()
+        record.update(extra)
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def measure(self, name: str):
+        rss_before = peak_rss_mb()
+        child_cpu_before = children_cpu()
+        cpu_before = time.thread_time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - started
+            self.add(name, wall, time.thread_time() - cpu_before,
+                     child_cpu_s=round(children_cpu() - child_cpu_before, 3),
+                     rss_growth_mb=round(peak_rss_mb() - rss_before, 1),
+                     offset_s=round(started - self.started, 3),
+                     thread=threading.current_thread().name)
+
+    def summary(self, **metadata) -> dict:
+        return {
+            **metadata,
+            'total_wall_s': round(time.perf_counter() - self.started, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': list(self.records),
+        }
+
+    def write(self, path: str, **metadata):
+        try:
+            write_artifact(path, json.dumps(self.summary(**metadata), indent=2))
+        except Exception as e:
+            print(f"[ERROR] Failed to write stage timings: {e}", file=sys.stderr)
@@ -57,40 +57,43 @@ document.addEventListener('DOMContentLoaded', function () {
     responseMessage.parentNode.insertBefore(retryButton, responseMessage.nextSibling);
 
     function pollProgress(taskId) {
-        const interval = setInterval(() => {
-            fetch(`/progress/${taskId}`)
-                .then(response => response.json())
-                .then(data => {
-                    console.log("Progress data:", data);
-                    const progress = data.progress;
-                    const message = data.message || "";
+        // One server-sent stream per tab; the server polls the task once for all viewers.
+        const source = new EventSource(`/progress/${taskId}/stream`);
 
-                    progressBar.style.width = `${progress}%`;
-                    responseMessage.textContent = message;
+        source.addEventListener('progress', event => {
+            const data = JSON.parse(event.data);
+            console.log("Progress data:", data);
+            const progress = data.progress;
+            const message = data.message || "";
 
-                    if (progress >= 100) {
-                        clearInterval(interval);
-                        responseMessage.textContent = "Done! Opening report...";
-                        progressContainer.style.display = 'none';
-                    
-                        const reportWindow = window.open(`/download/${taskId}`, '_blank');
-                        if (!reportWindow) {
-                            responseMessage.textContent = "Pop-up blocked. Please allow pop-ups and click Retry.";
-                            retryButton.style.display = 'inline-block';
-                        }
-                    } else if (progress < 0) {
-                        clearInterval(interval);
-                        responseMessage.textContent = "Something went wrong. Check the logs.";
-                        progressContainer.style.display = 'none';
-                    }
-                    
-                })
-                .catch(error => {
-                    clearInterval(interval);
-                    console.error('Polling error:', error);
-                    responseMessage.textContent = "Error checking progress.";
-                });
-        }, 3000);
+            progressBar.style.width = `${progress}%`;
+            responseMessage.textContent = message;
+
+            if (progress >= 100) {
+                source.close();
+                responseMessage.textContent = "Done! Opening report...";
+                progressContainer.style.display = 'none';
+
+                const reportWindow = window.open(data.download_url || `/download/${taskId}`, '_blank');
+                if (!reportWindow) {
+                    responseMessage.textContent = "Pop-up blocked. Please allow pop-ups and click Retry.";
+                    retryButton.style.display = 'inline-block';
+                }
+            } else if (progress < 0) {
+                source.close();
+                responseMessage.textContent = "Something went wrong. Check the logs.";
+                progressContainer.style.display = 'none';
+            }
+        });
+
+        source.onerror = error => {
+            // EventSource reconnects by itself after a dropped connection; a
+            // closed stream here means the server refused it (unknown task, 403).
+            if (source.readyState === EventSource.CLOSED) {
+                console.error('Progress stream error:', error);
+                responseMessage.textContent = "Error checking progress.";
+            }
+        };
     }
 
     form.addEventListener('submit', function (event) {
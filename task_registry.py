@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import List, Optional
+import boto3
+from botocore.exceptions import ClientError
+
+from dynamo_config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TASKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "tasks")
+
+# Finished tasks are dropped by DynamoDB TTL on expiresAt after this many days.
+TASK_TTL_DAYS = int(os.getenv("TASK_TTL_DAYS", 30))
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+class TaskRecord:
+    """A report task: who started it and where its progress and output live in S3."""
+
+    def __init__(self, item: dict):
+        self.task_id = item.get('TaskId')
+        self.owner_id = item.get('ownerId')
+        self.site = item.get('site')
+        self.report_id = item.get('reportId')
+        self.participant_id = item.get('participantId')
+        self.output_format = item.get('outputFormat')
+        self.bucket = item.get('bucket')
+        self.progress_key = item.get('progressKey')
+        self.output_key = item.get('outputKey')
+        self.status = item.get('status', 'queued')
+        self.viewer_ids = set(item.get('viewerIds', ()))
+        self.created_at = item.get('createdAt')
+        self.updated_at = item.get('updatedAt')
+        self.expires_at = item.get('expiresAt')
+        self.metadata = item.get('metadata', {})
+        # Web process that queued it, as "<host>/<boot id>/<pid>"; its queue is in memory
+        self.dispatcher = item.get('dispatcher')
+
+    @classmethod
+    def new(cls, task_id: str, owner_id: str, site: str, report_id: str, participant_id: str,
+            output_format: str, bucket: str, progress_key: str, output_key: str,
+            dispatcher: str = None) -> "TaskRecord":
+        now = datetime.utcnow().isoformat() + 'Z'
+        return cls({
+            'TaskId': task_id,
+            'ownerId': owner_id,
+            'site': site,
+            'reportId': report_id,
+            'participantId': participant_id,
+            'outputFormat': output_format,
+            'bucket': bucket,
+            'progressKey': progress_key,
+            'outputKey': output_key,
+            'status': 'queued',
+            'createdAt': now,
+            'updatedAt': now,
+            'expiresAt': int(time.time()) + TASK_TTL_DAYS * 86400,
+            'dispatcher': dispatcher,
+        })
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def can_view(self, user) -> bool:
+        """Admins see every task; others only tasks they started, or joined, for their site."""
+        if user.role == "admin":
+            return True
+        return self.site == user.site and (self.owner_id == user.id or user.id in self.viewer_ids)
+
+    def to_dict(self) -> dict:
+        """Convert task to DynamoDB item format."""
+        item = {
+            'TaskId': self.task_id,
+            'ownerId': self.owner_id,
+            'site': self.site,
+            'reportId': self.report_id,
+            'participantId': self.participant_id,
+            'outputFormat': self.output_format,
+            'bucket': self.bucket,
+            'progressKey': self.progress_key,
+            'outputKey': self.output_key,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+        }
+
+        if self.expires_at:
+            item['expiresAt'] = self.expires_at
+
+        if self.viewer_ids:
+            item['viewerIds'] = self.viewer_ids
+
+        if self.metadata:
+            item['metadata'] = self.metadata
+
+        if self.dispatcher:
+            item['dispatcher'] = self.dispatcher
+
+        return item
+
+    def __repr__(self):
+        return f"<Task {self.task_id}:{self.report_id}:{self.status}>"
+
+
+class LocalTaskRegistry:
+    """Task registry keeping one JSON file per task, for local development."""
+
+    def __init__(self, directory: str = DEFAULT_TASKS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, task_id: str) -> str:
+        # Task IDs are time_ns() strings; reject anything that could leave the directory.
+        if not task_id.isalnum():
+            raise ValueError(f"Invalid task id {task_id!r}")
+        return os.path.join(self.directory, f"{task_id}.json")
+
+    def register(self, task: TaskRecord) -> TaskRecord:
+        path = self._path(task.task_id)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w') as f:
+                json.dump(task.to_dict(), f, default=sorted)
+            os.replace(tmp_path, path)
+        return task
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        try:
+            with open(self._path(task_id)) as f:
+                return TaskRecord(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def update_status(self, task_id: str, status: str) -> bool:
+        task = self.get(task_id)
+        if not task:
+            return False
+        task.status = status
+        task.updated_at = datetime.utcnow().isoformat() + 'Z'
+        self.register(task)
+        return True
+
+    def add_viewer(self, task_id: str, user_id: str) -> bool:
+        task = self.get(task_id)
+        if not task:
+            return False
+        task.viewer_ids.add(user_id)
+        self.register(task)
+        return True
+
+    def list_unfinished(self) -> List[TaskRecord]:
+        tasks = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                task = self.get(name[:-len('.json')])
+                if task and not task.finished:
+                    tasks.append(task)
+        return tasks
+
+
+class DynamoTaskRegistry:
+    """Task registry in DynamoDB, keyed by TaskId so every lookup is a single get_item."""
+
+    def __init__(self):
+        try:
+            self.dynamodb = boto3.resource('dynamodb', **config.get_boto3_config())
+            self.table = self.dynamodb.Table(config.tasks_table_name)
+        except Exception as e:
+            logger.error(f"Failed to initialize DynamoDB task table: {e}")
+            raise
+
+    def register(self, task: TaskRecord) -> TaskRecord:
+        try:
+            self.table.put_item(Item=task.to_dict())
+            return task
+        except ClientError as e:
+            logger.error(f"Error registering task {task.task_id}: {e}")
+            raise
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        try:
+            item = self.table.get_item(Key={'TaskId': task_id}).get('Item')
+            return TaskRecord(item) if item else None
+        except ClientError as e:
+            logger.error(f"Error getting task {task_id}: {e}")
+            return None
+
+    def update_status(self, task_id: str, status: str) -> bool:
+        try:
+            self.table.update_item(
+                Key={'TaskId': task_id},
+                UpdateExpression='SET #status = :status, updatedAt = :timestamp',
+                ConditionExpression='attribute_exists(TaskId)',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':status': status,
+                    ':timestamp': datetime.utcnow().isoformat() + 'Z'
+                }
+            )
+            return True
+        except ClientError as e:
+            logger.error(f"Error updating task {task_id}: {e}")
+            return False
+
+    def add_viewer(self, task_id: str, user_id: str) -> bool:
+        """Let another user follow a task their identical request was coalesced onto."""
+        try:
+            self.table.update_item(
+                Key={'TaskId': task_id},
+                UpdateExpression='ADD viewerIds :ids',
+                ConditionExpression='attribute_exists(TaskId)',
+                ExpressionAttributeValues={':ids': {user_id}}
+            )
+            return True
+        except ClientError as e:
+            logger.error(f"Error adding viewer to task {task_id}: {e}")
+            return False
+
+    def list_unfinished(self) -> List[TaskRecord]:
+        """Queued and running tasks; a scan, so only for startup recovery."""
+        try:
+            scan_kwargs = {
+                'FilterExpression': '#status IN (:queued, :running)',
+                'ExpressionAttributeNames': {'#status': 'status'},
+                'ExpressionAttributeValues': {':queued': 'queued', ':running': 'running'},
+            }
+            response = self.table.scan(**scan_kwargs)
+            items = response.get('Items', [])
+
+            # Handle pagination
+            while 'LastEvaluatedKey' in response:
+                response = self.table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_kwargs)
+                items.extend(response.get('Items', []))
+
+            return [TaskRecord(item) for item in items]
+        except ClientError as e:
+            logger.error(f"Error listing unfinished tasks: {e}")
+            return []
+
+
+def create_task_registry():
+    """TASK_REGISTRY=local keeps tasks on disk (TASK_REGISTRY_DIR); anything else uses DynamoDB."""
+    if os.getenv("TASK_REGISTRY", "dynamodb") == "local":
+        return LocalTaskRegistry(os.getenv("TASK_REGISTRY_DIR", DEFAULT_TASKS_DIR))
+    return DynamoTaskRegistry()
+
+
+# Global registry instance
+task_registry = create_task_registry()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The report scripts import each other as top-level modules, and cortex/LAMP
+# come from the offline stand-in used by the benchmarks.
+for path in (os.path.join(ROOT, 'benchmarks', 'stand_in'), os.path.join(ROOT, 'reports', 'bidmc'), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault('BENCH_NOW', '1748736000000')
+# Modules such as parameter_store build boto3 clients at import
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+for name in ('LAMP_ACCESS_KEY', 'LAMP_SECRET_KEY', 'LAMP_SERVER_ADDRESS'):
+    os.environ.setdefault(name, 'test')
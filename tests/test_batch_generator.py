@@ -0,0 +1,25 @@
+import os
+import signal
+
+import batch_generator
+
+
+def _fake_report(participant_id, start_date, output_format, output_path, **kwargs):
+    if participant_id == 'U-oom':
+        os.kill(os.getpid(), signal.SIGKILL)
+    with open(output_path, 'w') as f:
+        f.write(participant_id)
+
+
+def test_killed_worker_fails_only_its_own_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_generator, 'generate_report', _fake_report)
+    participants = [('U-1', '2025-01-01'), ('U-oom', '2025-01-01'), ('U-2', '2025-01-01'), ('U-3', '2025-01-01')]
+    jobs = batch_generator.build_jobs(participants, str(tmp_path), 'html')
+
+    results = {r['participant_id']: r for r in batch_generator.run_batch(jobs, workers=2)}
+
+    assert results['U-oom']['status'] == 'failed'
+    assert 'killed by signal 9' in results['U-oom']['error']
+    for participant_id in ('U-1', 'U-2', 'U-3'):
+        assert results[participant_id]['status'] == 'done'
+        assert (tmp_path / f'{participant_id}.html').read_text() == participant_id
@@ -0,0 +1,86 @@
+import os
+import json
+import time
+
+import pytest
+
+import report_generator
+from cortex import _bench
+from checkpoint import StageCheckpoint, LocalCheckpointStore
+
+FINGERPRINT = {'participant_id': 'U1', 'start_date': '2025-01-01', 'output_format': 'html'}
+
+
+def test_stage_with_missing_pickle_is_not_completed(tmp_path):
+    checkpoint = StageCheckpoint(str(tmp_path), 'T1')
+    checkpoint.open(FINGERPRINT, {'end_ts': 1})
+    checkpoint.save('pull_passive', {'passive': {}})
+    checkpoint.save('pull_survey_scores', {'survey_responses': []})
+    os.remove(tmp_path / 'T1' / 'pull_passive.pkl')
+
+    resumed = StageCheckpoint(str(tmp_path), 'T1')
+    resumed.open(FINGERPRINT, {'end_ts': 2})
+    assert resumed.completed == {'pull_survey_scores'}
+    assert resumed.load('pull_survey_scores') == {'survey_responses': []}
+
+
+def test_expire_removes_whole_tasks_by_newest_object(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path))
+    old = time.time() - 7200
+    for task_id in ('stale', 'active'):
+        store.put(f'{task_id}/pull_passive.pkl', b'x')
+        store.put(f'{task_id}/manifest.json', b'{}')
+        os.utime(tmp_path / task_id / 'pull_passive.pkl', (old, old))
+    os.utime(tmp_path / 'stale' / 'manifest.json', (old, old))
+
+    store.expire(3600)
+    assert not (tmp_path / 'stale').exists()
+    assert sorted(os.listdir(tmp_path / 'active')) == ['manifest.json', 'pull_passive.pkl']
+
+
+def test_resumed_report_keeps_failed_features(tmp_path, monkeypatch):
+    output_path = str(tmp_path / 'report.html')
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("killed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(_bench, 'FAIL_FEATURES', {'steps'})
+        patch.setattr(report_generator, 'build_correlation_matrix', crash)
+        with pytest.raises(RuntimeError):
+            report_generator.generate_report('U1', '2025-01-01', 'html', output_path,
+                                             checkpoint=StageCheckpoint(str(tmp_path / 'ckpt'), 'T1'))
+
+    manifest = json.loads((tmp_path / 'ckpt' / 'T1' / 'manifest.json').read_text())
+    assert 'pull_passive' in manifest['stages']
+
+    report_generator.generate_report('U1', '2025-01-01', 'html', output_path,
+                                     checkpoint=StageCheckpoint(str(tmp_path / 'ckpt'), 'T1'))
+    with open(output_path) as f:
+        assert 'could not be retrieved (steps)' in f.read()
+    timings = json.loads((tmp_path / 'report.timings.json').read_text())
+    assert list(timings['pulls']['failed_features']) == ['steps']
+
+
+def test_s3_checkpoints_missing_stage_and_expiry(monkeypatch):
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('AWS_ENDPOINT_URL_S3', raising=False)
+    with moto.mock_aws():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket='checkpoints')
+        checkpoint = StageCheckpoint('s3://checkpoints/ckpt', 'T1')
+        checkpoint.open(FINGERPRINT, {'end_ts': 1})
+        checkpoint.save('pull_passive', {'passive': {}})
+        checkpoint.save('pull_survey_scores', {'survey_responses': []})
+        s3.delete_object(Bucket='checkpoints', Key='ckpt/T1/pull_passive.pkl')
+
+        resumed = StageCheckpoint('s3://checkpoints/ckpt', 'T1')
+        resumed.open(FINGERPRINT, {'end_ts': 2})
+        assert resumed.completed == {'pull_survey_scores'}
+
+        resumed.store.expire(-60)
+        assert 'Contents' not in s3.list_objects_v2(Bucket='checkpoints')
@@ -0,0 +1,34 @@
+from botocore.exceptions import EndpointConnectionError
+
+from parameter_store import ParameterStore
+
+
+class _UnreachableSSM:
+    def __init__(self):
+        self.calls = 0
+
+    def get_paginator(self, name):
+        self.calls += 1
+        raise EndpointConnectionError(endpoint_url='https://ssm.invalid')
+
+    def get_parameter(self, **kwargs):
+        self.calls += 1
+        raise EndpointConnectionError(endpoint_url='https://ssm.invalid')
+
+
+def test_unreachable_ssm_is_not_retried_per_lookup(monkeypatch):
+    monkeypatch.setenv('LAMP_ACCESS_KEY', 'from-env')
+    store = ParameterStore(ttl=3600, retry_after=60)
+    store.ssm = _UnreachableSSM()
+
+    assert [store.get_parameter('LAMP_ACCESS_KEY') for _ in range(5)] == ['from-env'] * 5
+    assert store.ssm.calls == 1
+
+
+def test_env_source_never_calls_ssm(monkeypatch):
+    monkeypatch.setenv('LAMP_ACCESS_KEY', 'from-env')
+    store = ParameterStore(source='env')
+
+    assert store.ssm is None
+    assert store.get_parameter('LAMP_ACCESS_KEY') == 'from-env'
+    assert store.stats()['source'] == 'env'
@@ -0,0 +1,37 @@
+import time
+
+from pipeline import Stage, run_stages
+
+
+class _RecordingCheckpoint:
+    completed = set()
+
+    def __init__(self):
+        self.saved = []
+
+    def save(self, stage_name, outputs):
+        self.saved.append(stage_name)
+
+
+def _after(seconds, value):
+    def func(**inputs):
+        time.sleep(seconds)
+        return value
+    return func
+
+
+def test_concurrent_stage_is_checkpointed_between_inline_stages():
+    stages = [
+        Stage('pull', _after(0.05, 'raw'), outputs=('raw',), concurrent=True, checkpoint=True),
+        Stage('first', _after(0.1, 1), outputs=('a',)),
+        Stage('second', _after(0.1, 2), inputs=('a',), outputs=('b',)),
+        Stage('third', _after(0.1, 3), inputs=('b',), outputs=('c',)),
+        Stage('uses_pull', _after(0, None), inputs=('raw', 'c')),
+    ]
+    checkpoint = _RecordingCheckpoint()
+    finished = []
+
+    run_stages(stages, {}, on_stage_complete=lambda stage: finished.append(stage.name), checkpoint=checkpoint)
+
+    assert finished.index('pull') < finished.index('third')
+    assert checkpoint.saved == ['pull']
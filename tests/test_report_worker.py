@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+from report_worker import StdinJobSource, SpoolJobSource
+
+
+class _Pipe:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+
+def test_stdin_jobs_written_together_are_read_without_eof():
+    read_fd, write_fd = os.pipe()
+    source = StdinJobSource(_Pipe(read_fd))
+    try:
+        os.write(write_fd, b'{"job_id": "a"}\n{"job_id": "b"}\n')
+        started = time.monotonic()
+        jobs = [source.next_job(0.1) for _ in range(2)]
+        assert [job['job_id'] for job in jobs] == ['a', 'b']
+        assert time.monotonic() - started < 1
+        assert not source.closed
+    finally:
+        os.close(write_fd)
+    assert source.next_job(0.1) is None
+    assert source.closed
+    os.close(read_fd)
+
+
+def test_stdin_last_line_without_newline():
+    read_fd, write_fd = os.pipe()
+    source = StdinJobSource(_Pipe(read_fd))
+    os.write(write_fd, b'{"job_id": "a"}')
+    os.close(write_fd)
+    job = None
+    while job is None and not source.closed:
+        job = source.next_job(0.1)
+    assert job == {'job_id': 'a'}
+    os.close(read_fd)
+
+
+def test_spool_requeues_jobs_of_dead_workers(tmp_path):
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    pid = finished.pid  # no longer alive
+    (tmp_path / f"j1.{pid}.running").write_text(json.dumps({'participant_id': 'U1'}))
+    (tmp_path / f"j2.{os.getppid()}.running").write_text(json.dumps({'participant_id': 'U2'}))
+
+    source = SpoolJobSource(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted(['j1.json', f"j2.{os.getppid()}.running"])
+
+    job = source.next_job(0)
+    assert job['job_id'] == 'j1'
+    source.finish(job, {'status': 'done'})
+    assert json.loads((tmp_path / 'j1.done').read_text())['result'] == {'status': 'done'}
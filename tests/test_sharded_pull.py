@@ -0,0 +1,19 @@
+from sharded_pull import MS_IN_DAY, merge_lists, pull_sharded
+from stage_timing import StageTimer
+
+
+def test_each_shard_is_timed():
+    timer = StageTimer()
+    result = pull_sharded(lambda start, end: [start], 0, 200 * MS_IN_DAY, merge_lists,
+                          label='cortex.run(steps)', shard_days=90, timer=timer)
+
+    assert result == [0, 90 * MS_IN_DAY, 180 * MS_IN_DAY]
+    assert sorted(record['stage'] for record in timer.records) == [
+        'cortex.run(steps) shard 1/3', 'cortex.run(steps) shard 2/3', 'cortex.run(steps) shard 3/3']
+
+
+def test_single_shard_is_timed_under_its_label():
+    timer = StageTimer()
+    pull_sharded(lambda start, end: [], 0, MS_IN_DAY, merge_lists, label='survey_scores', timer=timer)
+
+    assert [record['stage'] for record in timer.records] == ['survey_scores']